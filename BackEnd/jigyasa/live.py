@@ -0,0 +1,274 @@
+"""
+Live survey results over Server-Sent Events.
+
+Submissions publish a small count delta to the broker once their transaction
+commits. Each process keeps one LiveFeed per watched survey: it aggregates the
+results once, keeps them current by applying deltas, and fans the deltas out
+to every connected viewer, so viewers never re-aggregate the survey.
+
+The broker is pluggable through settings.LIVE_RESULTS_BROKER. The default
+LocalBroker only reaches viewers connected to the same process.
+
+Browsers' EventSource cannot send an Authorization header, so the stream also
+accepts a LiveResultsToken in the ?token= query string: a JWT for one survey
+that expires after LIVE_RESULTS_TOKEN_LIFETIME and is not accepted anywhere else.
+"""
+import json
+import queue
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.renderers import BaseRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import SurveyResponse
+from .storage import tally_results
+
+
+class LocalBroker:
+    """In-process pub/sub; callbacks run in the publishing thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].append(callback)
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(channel, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(channel, None)
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            callback(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'LIVE_RESULTS_BROKER', 'jigyasa.live.LocalBroker'))()
+        return _broker
+
+
+def channel_name(survey_id):
+    return f'survey-results-{survey_id}'
+
+
+def submission_delta(response, answers_data):
+    questions = {}
+    for answer_data in answers_data:
+        question = questions.setdefault(int(answer_data.get('question')), {'choices': {}, 'text_answers': 0})
+        if answer_data.get('text_answer'):
+            question['text_answers'] += 1
+        for choice_id in answer_data.get('selected_choices') or []:
+            question['choices'][int(choice_id)] = question['choices'].get(int(choice_id), 0) + 1
+    return {'response': response.id, 'responses': 1, 'questions': questions}
+
+
+def publish_submission(response, answers_data):
+    """Publish a submission's count delta once the surrounding transaction commits."""
+    delta = submission_delta(response, answers_data)
+    transaction.on_commit(lambda: get_broker().publish(channel_name(response.survey_id), delta))
+
+
+class LiveResultsToken(AccessToken):
+    """Short-lived token for opening one survey's live results stream."""
+    token_type = 'live_results'
+    lifetime = getattr(settings, 'LIVE_RESULTS_TOKEN_LIFETIME', timedelta(seconds=60))
+
+    @classmethod
+    def for_survey(cls, user, survey):
+        token = cls.for_user(user)
+        token['survey'] = survey.id
+        return token
+
+
+class LiveTokenAuthentication(JWTAuthentication):
+    """Authenticates with a LiveResultsToken from the ?token= query string."""
+
+    def authenticate(self, request):
+        raw_token = request.query_params.get('token')
+        if not raw_token:
+            return None
+        try:
+            token = LiveResultsToken(raw_token)
+        except TokenError as e:
+            raise InvalidToken(str(e))
+        return self.get_user(token), token
+
+
+class FeedUnavailable(Exception):
+    pass
+
+
+class LiveFeed:
+    """Shared aggregation for one survey, fanned out to its viewers."""
+
+    def __init__(self, survey):
+        self.survey = survey
+        self._lock = threading.Lock()
+        self._viewers = set()
+        self._results = None
+        self._counted_up_to = 0
+        # Deltas received while the initial tally runs, or None when not starting
+        self._pending = None
+        # Why the initial tally failed; viewers waiting for it give up
+        self._error = None
+        self._ready = threading.Event()
+
+    def add_viewer(self):
+        viewer = queue.Queue(maxsize=getattr(settings, 'LIVE_RESULTS_VIEWER_QUEUE', 1000))
+        with self._lock:
+            start = not self._viewers
+            self._viewers.add(viewer)
+        if start:
+            with self._lock:
+                self._pending = []
+                self._error = None
+            try:
+                get_broker().subscribe(channel_name(self.survey.id), self.apply)
+                with transaction.atomic():
+                    # The tally counts exactly the responses up to this id
+                    last_response_id = SurveyResponse.objects.filter(survey=self.survey).order_by('-id').values_list('id', flat=True).first() or 0
+                    results = tally_results(self.survey, last_response_id)
+            except Exception as e:
+                with self._lock:
+                    self._pending = None
+                    self._error = e
+                self._ready.set()
+                # The last viewer to leave unsubscribes, so the next one starts over
+                self.remove_viewer(viewer)
+                raise FeedUnavailable("Live results are unavailable.") from e
+            with self._lock:
+                self._results = results
+                self._counted_up_to = last_response_id
+                pending, self._pending = self._pending, None
+                for delta in pending:
+                    self._add(delta)
+            self._ready.set()
+        self._ready.wait()
+        if self._error is not None:
+            self.remove_viewer(viewer)
+            raise FeedUnavailable("Live results are unavailable.") from self._error
+        return viewer
+
+    def remove_viewer(self, viewer):
+        with self._lock:
+            self._viewers.discard(viewer)
+            stop = not self._viewers
+            if stop:
+                self._results = None
+                self._pending = None
+                self._ready.clear()
+        if stop:
+            get_broker().unsubscribe(channel_name(self.survey.id), self.apply)
+            with _feeds_lock:
+                if _feeds.get(self.survey.id) is self and not self._viewers:
+                    del _feeds[self.survey.id]
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._results)) if self._results is not None else None
+
+    def _add(self, delta):
+        """Count a delta into the results, unless its response is already counted. Call with the lock held."""
+        if delta['response'] <= self._counted_up_to:
+            return False
+        self._results['responses'] += delta['responses']
+        for question_id, change in delta['questions'].items():
+            question = self._results['questions'].get(int(question_id))
+            if question is None:
+                continue
+            question['text_answers'] += change['text_answers']
+            for choice_id, count in change['choices'].items():
+                if int(choice_id) in question['choices']:
+                    question['choices'][int(choice_id)] += count
+        return True
+
+    def apply(self, delta):
+        with self._lock:
+            if self._pending is not None:
+                # Replayed once the initial tally is in; viewers are sent that state as their snapshot
+                self._pending.append(delta)
+                return
+            if self._results is None or not self._add(delta):
+                return
+            viewers = list(self._viewers)
+
+        for viewer in viewers:
+            try:
+                viewer.put_nowait(('delta', delta))
+            except queue.Full:
+                # Slow viewer: drop its backlog and resend the whole state instead
+                with viewer.mutex:
+                    viewer.queue.clear()
+                viewer.put_nowait(('snapshot', None))
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed(survey):
+    with _feeds_lock:
+        feed = _feeds.get(survey.id)
+        if feed is None:
+            feed = _feeds[survey.id] = LiveFeed(survey)
+        return feed
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def event_stream(survey):
+    """Yield SSE messages: the current results first, then count deltas."""
+    feed = get_feed(survey)
+    viewer = None
+    keepalive = getattr(settings, 'LIVE_RESULTS_KEEPALIVE', 15)
+    try:
+        try:
+            viewer = feed.add_viewer()
+        except FeedUnavailable as e:
+            # add_viewer has already left the feed
+            yield format_event('error', {'detail': str(e)})
+            return
+        yield format_event('snapshot', feed.snapshot())
+        while True:
+            try:
+                event, data = viewer.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event, feed.snapshot() if event == 'snapshot' else data)
+    finally:
+        if viewer is not None:
+            feed.remove_viewer(viewer)
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error responses are rendered here; the stream itself bypasses renderers
+        return format_event('error', data)
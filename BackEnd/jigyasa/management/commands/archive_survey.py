@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from jigyasa.models import Survey
+from jigyasa.storage import archive_survey
+
+class Command(BaseCommand):
+    help = 'Moves the responses of closed surveys into compressed archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_ids', nargs='*', type=int)
+        parser.add_argument('--all-closed', action='store_true', help='Archive every closed survey')
+
+    def handle(self, *args, **options):
+        if options['all_closed']:
+            surveys = Survey.objects.filter(is_active=False)
+        elif options['survey_ids']:
+            surveys = Survey.objects.filter(id__in=options['survey_ids'])
+        else:
+            raise CommandError('Pass survey ids or --all-closed')
+
+        for survey in surveys:
+            if survey.is_active:
+                self.stdout.write(self.style.WARNING(f'Skipping active survey: {survey.title} ({survey.id})'))
+                continue
+
+            archived = archive_survey(survey)
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} responses of survey: {survey.title} ({survey.id})'))
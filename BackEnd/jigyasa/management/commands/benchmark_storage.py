@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.contrib.auth import get_user_model
+from jigyasa.models import Survey, Question, Choice, SurveyResponse, Answer
+from jigyasa.storage import save_response
+
+
+class Command(BaseCommand):
+    help = 'Compares insert throughput and size of row and compact response storage (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--responses', type=int, default=1000)
+        parser.add_argument('--questions', type=int, default=50)
+        parser.add_argument('--choices', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = get_user_model().objects.create(username='storage-benchmark', email='storage-benchmark@example.com')
+            for mode in ['rows', 'compact']:
+                self.run_mode(user, mode, options)
+            transaction.set_rollback(True)
+
+    def run_mode(self, user, mode, options):
+        survey = Survey.objects.create(title=f'Benchmark ({mode})', description='', creator=user, storage_mode=mode)
+        answers_data = []
+        for i in range(options['questions']):
+            question = Question.objects.create(survey=survey, text=f'Question {i}', question_type='single_choice')
+            choices = [Choice(question=question, text=f'Choice {j}') for j in range(options['choices'])]
+            Choice.objects.bulk_create(choices)
+            answers_data.append({'question': question.id, 'selected_choices': [choices[i % len(choices)].id]})
+
+        size_before = self.database_size()
+        start = time.perf_counter()
+        for _ in range(options['responses']):
+            save_response(survey, user, answers_data)
+        elapsed = time.perf_counter() - start
+        size_after = self.database_size()
+
+        rows = (
+            SurveyResponse.objects.filter(survey=survey).count()
+            + Answer.objects.filter(response__survey=survey).count()
+            + Answer.selected_choices.through.objects.filter(answer__response__survey=survey).count()
+        )
+        self.stdout.write(f'{mode}: {options["responses"] / elapsed:.0f} responses/s, {rows} rows')
+        if size_before is not None:
+            self.stdout.write(f'{mode}: {(size_after - size_before) / 1024:.0f} KiB written')
+
+    def database_size(self):
+        if connection.vendor != 'sqlite':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA page_count')
+            page_count = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return page_count * cursor.fetchone()[0]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jigyasa', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='storage_mode',
+            field=models.CharField(choices=[('rows', 'Rows'), ('compact', 'Compact')], default='rows', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='surveyresponse',
+            name='packed_answers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
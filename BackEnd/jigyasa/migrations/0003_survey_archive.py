@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:06
+
+import jigyasa.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jigyasa', '0002_survey_storage_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='archive',
+            field=models.FileField(blank=True, upload_to=jigyasa.models.archive_upload_to),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='archived_responses',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
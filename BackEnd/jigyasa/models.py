@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+import os
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -52,13 +53,26 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.email}'s profile"
 
+def archive_upload_to(instance, filename):
+    return os.path.join('archives', 'surveys', filename)
+
 class Survey(models.Model):
+    STORAGE_MODES = [
+        ('rows', 'Rows'),
+        ('compact', 'Compact')
+    ]
+
     title = models.CharField(max_length=200)
     description = models.TextField()
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
     organization = models.ForeignKey(Organization, on_delete=models.SET_NULL, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     requires_organization = models.BooleanField(default=False)
+    # 'compact' keeps each response's answers packed into one SurveyResponse row
+    storage_mode = models.CharField(max_length=10, choices=STORAGE_MODES, default='rows')
+    # Responses moved out of the database by the archive_survey command
+    archive = models.FileField(upload_to=archive_upload_to, blank=True)
+    archived_responses = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -103,6 +117,8 @@ class SurveyResponse(models.Model):
     survey = models.ForeignKey(Survey, on_delete=models.CASCADE)
     respondent = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    # Used instead of Answer rows when the survey is in compact storage mode
+    packed_answers = models.JSONField(null=True, blank=True)
 
     class Meta:
         app_label = 'jigyasa'
@@ -0,0 +1,83 @@
+"""
+Database routing for analytics reads.
+
+When settings.DATABASES has an 'analytics' alias (a replica, or a second
+SQLite file locally), reads made inside analytics_reads() go there; every
+write still goes to 'default'. A user who has just written is pinned to
+'default' for ANALYTICS_READ_YOUR_WRITES_SECONDS so they see their own
+changes before the replica catches up.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+ANALYTICS_DB_ALIAS = 'analytics'
+
+_analytics_reads = contextvars.ContextVar('analytics_reads', default=False)
+
+
+def pin_key(user_id):
+    return f'analytics_pin_{user_id}'
+
+
+def pin_to_primary(user):
+    """Send this user's analytics reads to the primary database for a while."""
+    cache.set(pin_key(user.id), True, getattr(settings, 'ANALYTICS_READ_YOUR_WRITES_SECONDS', 30))
+
+
+def start_analytics_reads(user=None):
+    pinned = user is not None and user.is_authenticated and cache.get(pin_key(user.id), False)
+    return _analytics_reads.set(not pinned)
+
+
+def end_analytics_reads(token):
+    _analytics_reads.reset(token)
+
+
+@contextmanager
+def analytics_reads(user=None):
+    token = start_analytics_reads(user)
+    try:
+        yield
+    finally:
+        end_analytics_reads(token)
+
+
+class AnalyticsRouter:
+    def db_for_read(self, model, **hints):
+        if _analytics_reads.get() and ANALYTICS_DB_ALIAS in settings.DATABASES:
+            return ANALYTICS_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Objects read from the analytics database must still be saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, ANALYTICS_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class AnalyticsReadMixin:
+    """Serve the view's read-only analytics actions from the analytics database."""
+    analytics_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and getattr(self, 'action', None) in self.analytics_actions:
+            self._analytics_token = start_analytics_reads(request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_analytics_token', None)
+        if token is not None:
+            end_analytics_reads(token)
+            self._analytics_token = None
+        if request.method not in SAFE_METHODS and request.user.is_authenticated and response.status_code < 400:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from .models import User, Survey, Question, Choice, Answer, SurveyResponse, Organization, UserProfile
+from .storage import serialized_answers
 
 User = get_user_model()
 
@@ -50,9 +51,9 @@ class SurveySerializer(serializers.ModelSerializer):
     class Meta:
         model = Survey
         fields = ['id', 'title', 'description', 'creator', 'organization', 'organization_id', 
-                 'is_active', 'requires_organization', 'questions', 'responses_count', 
-                 'created_at', 'updated_at']
-        read_only_fields = ['creator', 'responses_count']
+                 'is_active', 'requires_organization', 'storage_mode', 'questions', 'responses_count', 
+                 'archived_responses', 'created_at', 'updated_at']
+        read_only_fields = ['creator', 'responses_count', 'archived_responses']
 
     def validate(self, data):
         requires_org = data.get('requires_organization', False)
@@ -65,7 +66,7 @@ class SurveySerializer(serializers.ModelSerializer):
         return data
 
     def get_responses_count(self, obj):
-        return obj.surveyresponse_set.count()
+        return obj.surveyresponse_set.count() + obj.archived_responses
 
     def create(self, validated_data):
         questions_data = validated_data.pop('questions', [])
@@ -88,6 +89,7 @@ class SurveySerializer(serializers.ModelSerializer):
         instance.description = validated_data.get('description', instance.description)
         instance.is_active = validated_data.get('is_active', instance.is_active)
         instance.requires_organization = validated_data.get('requires_organization', instance.requires_organization)
+        instance.storage_mode = validated_data.get('storage_mode', instance.storage_mode)
         instance.save()
 
         # Handle questions update
@@ -210,6 +212,14 @@ class SurveyResponseSerializer(serializers.ModelSerializer):
         model = SurveyResponse
         fields = ['id', 'survey', 'respondent', 'submitted_at', 'answers']
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Compact responses have no Answer rows; read them from the packed column
+        packed = serialized_answers(instance)
+        if packed is not None:
+            data['answers'] = packed
+        return data
+
     def create(self, validated_data):
         answers_data = validated_data.pop('answer_set', [])
         response = SurveyResponse.objects.create(**validated_data)
@@ -0,0 +1,376 @@
+"""
+Response storage for surveys.
+
+Surveys in 'rows' mode store one Answer row per question (plus the
+selected_choices through rows). Surveys in 'compact' mode store the whole
+submission in SurveyResponse.packed_answers as
+{"<question_id>": [[choice_ids], text_answer]}, with text_answer left out
+when it is empty. The read helpers below return the same shape for both
+modes, so serializers and aggregates do not need to care which one is used.
+
+Closed surveys can also be archived: their responses are written to a
+compressed columnar .npz file (Survey.archive) and deleted from the database.
+The read helpers include archived responses transparently. Archives are
+written a batch of rows at a time, loaded archives are cached per process,
+and results tally them with numpy instead of row by row.
+"""
+import io
+import tempfile
+import zipfile
+from collections import defaultdict
+from datetime import timezone
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Question, Survey, SurveyResponse, Answer
+
+# Rows converted to arrays at a time while writing an archive
+ARCHIVE_BATCH_SIZE = 10_000
+# Loaded archives kept per process
+ARCHIVE_CACHE_SIZE = 16
+
+
+def pack_answers(answers_data):
+    packed = {}
+    for answer_data in answers_data:
+        selected_choices = [int(choice) for choice in answer_data.get('selected_choices') or []]
+        text_answer = answer_data.get('text_answer', None)
+        value = [selected_choices]
+        if text_answer is not None:
+            value.append(text_answer)
+        packed[str(answer_data.get('question'))] = value
+    return packed
+
+
+def unpack_answers(packed):
+    """Yield (question_id, text_answer, choice_ids) for a packed response."""
+    for question_id, value in (packed or {}).items():
+        text_answer = value[1] if len(value) > 1 else None
+        yield int(question_id), text_answer, value[0]
+
+
+def check_answers(survey, answers_data):
+    """Raise ValidationError unless every answer is to a question of survey and selects only that question's choices.
+
+    Both storage modes check submissions here, so they accept the same input.
+    """
+    choices = {}
+    for question_id, choice_id in Question.objects.filter(survey=survey).values_list('id', 'choice__id'):
+        options = choices.setdefault(question_id, set())
+        if choice_id is not None:
+            options.add(choice_id)
+
+    for answer_data in answers_data:
+        question_id = int(answer_data.get('question'))
+        if question_id not in choices:
+            raise serializers.ValidationError({'question': f'Question {question_id} is not part of this survey.'})
+        invalid = [choice for choice in answer_data.get('selected_choices') or [] if int(choice) not in choices[question_id]]
+        if invalid:
+            raise serializers.ValidationError({
+                'selected_choices': f"Choices {', '.join(map(str, invalid))} are not options of question {question_id}."
+            })
+
+
+def save_response(survey, respondent, answers_data):
+    """Store a submission using the survey's storage mode."""
+    check_answers(survey, answers_data)
+    if survey.storage_mode == 'compact':
+        return SurveyResponse.objects.create(
+            survey=survey,
+            respondent=respondent,
+            packed_answers=pack_answers(answers_data)
+        )
+
+    response = SurveyResponse.objects.create(survey=survey, respondent=respondent)
+    for answer_data in answers_data:
+        question = Question.objects.get(id=answer_data.get('question'), survey=survey)
+        selected_choices = answer_data.get('selected_choices', [])
+        answer = Answer.objects.create(
+            response=response,
+            question=question,
+            text_answer=answer_data.get('text_answer', None)
+        )
+        if selected_choices:
+            answer.selected_choices.set(selected_choices)
+    return response
+
+
+def serialized_answers(response):
+    """Answers of a compact response in AnswerSerializer's shape, or None for row storage."""
+    if response.packed_answers is None:
+        return None
+    return [
+        {'id': None, 'question': question_id, 'text_answer': text_answer, 'selected_choices': choice_ids}
+        for question_id, text_answer, choice_ids in unpack_answers(response.packed_answers)
+    ]
+
+
+def iter_survey_answers(survey, max_response_id=None):
+    """Yield (response_id, question_id, text_answer, choice_ids) for every answer to a survey."""
+    if survey.archive:
+        yield from archived_answers(load_archive(survey))
+    yield from live_answers(survey, max_response_id)
+
+
+def live_answers(survey, max_response_id=None):
+    responses = SurveyResponse.objects.filter(survey=survey)
+    if max_response_id is not None:
+        responses = responses.filter(id__lte=max_response_id)
+
+    # Row storage: read the through table once instead of per answer
+    choices_by_answer = defaultdict(list)
+    through = Answer.selected_choices.through.objects.filter(answer__response__in=responses)
+    for answer_id, choice_id in through.values_list('answer_id', 'choice_id').iterator():
+        choices_by_answer[answer_id].append(choice_id)
+
+    answers = Answer.objects.filter(response__in=responses).values_list(
+        'id', 'response_id', 'question_id', 'text_answer'
+    )
+    for answer_id, response_id, question_id, text_answer in answers.iterator():
+        yield response_id, question_id, text_answer, choices_by_answer.get(answer_id, [])
+
+    # Compact storage (a survey may hold both if its mode was switched)
+    packed = responses.filter(packed_answers__isnull=False).values_list(
+        'id', 'packed_answers'
+    )
+    for response_id, packed_answers in packed.iterator():
+        for question_id, text_answer, choice_ids in unpack_answers(packed_answers):
+            yield response_id, question_id, text_answer, choice_ids
+
+
+def tally_results(survey, max_response_id=None):
+    """Per-question choice counts and text answer counts for a survey.
+
+    With max_response_id, only database responses up to that id are counted.
+    """
+    questions = {}
+    for question in Question.objects.filter(survey=survey).prefetch_related('choice_set'):
+        questions[question.id] = {
+            'text': question.text,
+            'question_type': question.question_type,
+            'choices': {choice.id: 0 for choice in question.choice_set.all()},
+            'text_answers': 0,
+        }
+
+    if survey.archive:
+        tally_archive(questions, load_archive(survey))
+
+    responses = SurveyResponse.objects.filter(survey=survey)
+    if max_response_id is not None:
+        responses = responses.filter(id__lte=max_response_id)
+    for _, question_id, text_answer, choice_ids in live_answers(survey, max_response_id):
+        result = questions.get(question_id)
+        if result is None:
+            continue
+        if text_answer:
+            result['text_answers'] += 1
+        for choice_id in choice_ids:
+            if choice_id in result['choices']:
+                result['choices'][choice_id] += 1
+
+    return {
+        'survey': survey.id,
+        'responses': responses.count() + survey.archived_responses,
+        'questions': questions,
+    }
+
+
+def tally_archive(questions, columns):
+    """Add an archive's choice and text answer counts to tally_results()' questions."""
+    question_ids = np.array(list(questions), dtype=np.int64)
+    choice_ids = np.array([choice_id for result in questions.values() for choice_id in result['choices']], dtype=np.int64)
+    choice_questions = np.repeat(question_ids, [len(result['choices']) for result in questions.values()])
+
+    # Only count choices of the question they answer, as for live answers
+    answered = np.repeat(columns['answer_question_id'], np.diff(columns['choice_offsets']))
+    selected = columns['choice_ids']
+    size = int(max(selected.max(initial=0), choice_ids.max(initial=0))) + 1
+    owner = np.full(size, -1, dtype=np.int64)
+    owner[choice_ids] = choice_questions
+    choice_counts = np.bincount(selected[owner[selected] == answered], minlength=size)
+
+    with_text = columns['answer_has_text'] & (columns['answer_text'] != '')
+    texts = columns['answer_question_id'][with_text]
+    known = np.isin(texts, question_ids)
+    text_questions, text_counts = np.unique(texts[known], return_counts=True)
+    text_counts = dict(zip(text_questions.tolist(), text_counts.tolist()))
+
+    for question_id, result in questions.items():
+        result['text_answers'] += text_counts.get(question_id, 0)
+        for choice_id in result['choices']:
+            result['choices'][choice_id] += int(choice_counts[choice_id])
+
+
+def load_archive(survey):
+    """Columns of a survey's archive, as read-only arrays shared by callers in this process."""
+    # A rewritten archive may reuse the old file name, but never with the same response count
+    return read_archive(survey.archive.name, survey.archived_responses)
+
+
+@lru_cache(maxsize=ARCHIVE_CACHE_SIZE)
+def read_archive(name, archived_responses):
+    with Survey._meta.get_field('archive').storage.open(name, 'rb') as archive_file:
+        with np.load(io.BytesIO(archive_file.read())) as data:
+            columns = {column: data[column] for column in data.files}
+    for array in columns.values():
+        array.flags.writeable = False
+    return columns
+
+
+def archived_answers(columns):
+    offsets = columns['choice_offsets'].tolist()
+    choice_ids = columns['choice_ids'].tolist()
+    rows = zip(
+        columns['answer_response_id'].tolist(),
+        columns['answer_question_id'].tolist(),
+        columns['answer_text'].tolist(),
+        columns['answer_has_text'].tolist(),
+    )
+    for i, (response_id, question_id, text_answer, has_text) in enumerate(rows):
+        yield response_id, question_id, text_answer if has_text else None, choice_ids[offsets[i]:offsets[i + 1]]
+
+
+def archived_response_rows(columns):
+    """Yield (response_id, respondent_id, submitted_at) for an archive."""
+    rows = zip(
+        columns['response_id'].tolist(),
+        columns['respondent_id'].tolist(),
+        columns['submitted_at'].astype('datetime64[us]').tolist(),
+    )
+    for response_id, respondent_id, submitted_at in rows:
+        yield response_id, respondent_id if respondent_id >= 0 else None, submitted_at.replace(tzinfo=timezone.utc)
+
+
+def archived_responses(survey):
+    """Archived responses in SurveyResponseSerializer's shape."""
+    columns = load_archive(survey)
+    answers_by_response = defaultdict(list)
+    for response_id, question_id, text_answer, choice_ids in archived_answers(columns):
+        answers_by_response[response_id].append(
+            {'id': None, 'question': question_id, 'text_answer': text_answer, 'selected_choices': choice_ids}
+        )
+
+    responses = list(archived_response_rows(columns))
+    respondent_ids = {respondent_id for _, respondent_id, _ in responses if respondent_id is not None}
+    usernames = dict(get_user_model().objects.filter(id__in=respondent_ids).values_list('id', 'username'))
+    submitted_at_field = serializers.DateTimeField()
+
+    return [
+        {
+            'id': response_id,
+            'survey': survey.id,
+            'respondent': usernames.get(respondent_id),
+            'submitted_at': submitted_at_field.to_representation(submitted_at),
+            'answers': answers_by_response.get(response_id, []),
+        }
+        for response_id, respondent_id, submitted_at in responses
+    ]
+
+
+def batches(rows, size=ARCHIVE_BATCH_SIZE):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class ArchiveWriter:
+    """Columns of an .npz archive, appended a batch at a time.
+
+    Batches are spilled to temporary files as they come, then streamed into
+    the archive one column at a time, so only one batch is held in memory.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.lengths = {}
+        self.dtypes = {}
+
+    def append(self, name, array):
+        file = self.files.setdefault(name, tempfile.TemporaryFile())
+        np.save(file, array, allow_pickle=False)
+        self.lengths[name] = self.lengths.get(name, 0) + len(array)
+        # Text columns take the widest batch's width
+        self.dtypes[name] = np.promote_types(self.dtypes.get(name, array.dtype), array.dtype)
+
+    def write(self, target):
+        with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, file in self.files.items():
+                dtype = self.dtypes[name]
+                file.seek(0)
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as entry:
+                    np.lib.format.write_array_header_1_0(entry, {
+                        'descr': np.lib.format.dtype_to_descr(dtype),
+                        'fortran_order': False,
+                        'shape': (self.lengths[name],),
+                    })
+                    written = 0
+                    while written < self.lengths[name]:
+                        batch = np.load(file, allow_pickle=False)
+                        entry.write(batch.astype(dtype, copy=False).tobytes())
+                        written += len(batch)
+                file.close()
+
+
+def archive_survey(survey):
+    """Move a survey's responses into its compressed archive and delete the rows.
+
+    Returns the number of responses archived by this call.
+    """
+    max_response_id = SurveyResponse.objects.filter(survey=survey).order_by('-id').values_list('id', flat=True).first()
+    if max_response_id is None:
+        return 0
+
+    writer = ArchiveWriter()
+    writer.append('choice_offsets', np.zeros(1, dtype=np.int64))
+    choice_count = 0
+    if survey.archive:
+        columns = load_archive(survey)
+        for name in ['response_id', 'respondent_id', 'submitted_at', 'answer_response_id', 'answer_question_id',
+                     'answer_text', 'answer_has_text', 'choice_ids']:
+            writer.append(name, columns[name])
+        writer.append('choice_offsets', columns['choice_offsets'][1:])
+        choice_count = int(columns['choice_offsets'][-1])
+
+    live = SurveyResponse.objects.filter(survey=survey, id__lte=max_response_id)
+    archived_count = 0
+    rows = live.values_list('id', 'respondent_id', 'submitted_at').iterator()
+    for batch in batches(rows):
+        archived_count += len(batch)
+        writer.append('response_id', np.array([r[0] for r in batch], dtype=np.int64))
+        writer.append('respondent_id', np.array([r[1] if r[1] is not None else -1 for r in batch], dtype=np.int64))
+        writer.append('submitted_at', np.array([r[2].astimezone(timezone.utc).replace(tzinfo=None) for r in batch], dtype='datetime64[us]'))
+
+    for batch in batches(live_answers(survey, max_response_id)):
+        choice_counts = np.array([len(a[3]) for a in batch], dtype=np.int64)
+        writer.append('answer_response_id', np.array([a[0] for a in batch], dtype=np.int64))
+        writer.append('answer_question_id', np.array([a[1] for a in batch], dtype=np.int64))
+        writer.append('answer_text', np.array([a[2] or '' for a in batch], dtype=str))
+        writer.append('answer_has_text', np.array([a[2] is not None for a in batch], dtype=bool))
+        writer.append('choice_offsets', choice_count + np.cumsum(choice_counts))
+        writer.append('choice_ids', np.array([c for a in batch for c in a[3]], dtype=np.int64))
+        choice_count += int(choice_counts.sum())
+
+    # Columns that got no rows still need their dtype
+    for name, dtype in [('answer_response_id', np.int64), ('answer_question_id', np.int64), ('answer_text', str),
+                        ('answer_has_text', bool), ('choice_ids', np.int64)]:
+        if name not in writer.files:
+            writer.append(name, np.array([], dtype=dtype))
+
+    old_archive = survey.archive.name if survey.archive else None
+    with tempfile.TemporaryFile() as target:
+        writer.write(target)
+        target.seek(0)
+        with transaction.atomic():
+            survey.archive.save(f'{survey.id}.npz', File(target), save=False)
+            survey.archived_responses = writer.lengths['response_id']
+            survey.save(update_fields=['archive', 'archived_responses'])
+            live.delete()
+    if old_archive:
+        survey.archive.storage.delete(old_archive)
+    return archived_count
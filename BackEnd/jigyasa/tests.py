@@ -1,3 +1,124 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from .models import Survey, Question, User
+from .storage import archive_survey, archived_responses, tally_results
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SurveyTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='secret')
+        self.client.force_authenticate(self.user)
+
+    def create_survey(self, storage_mode='rows'):
+        response = self.client.post('/api/surveys/', {
+            'title': 'Survey', 'description': 'Test survey',
+            'questions': [
+                {'text': 'Pick some', 'question_type': 'multiple_choice', 'choices': [{'text': 'A'}, {'text': 'B'}, {'text': 'C'}]},
+                {'text': 'Comments', 'question_type': 'text', 'choices': []},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        survey = Survey.objects.get(id=response.data['id'])
+        survey.storage_mode = storage_mode
+        survey.save()
+        choice_question, text_question = Question.objects.filter(survey=survey).order_by('id')
+        choices = list(choice_question.choice_set.order_by('id').values_list('id', flat=True))
+        return survey, choice_question, text_question, choices
+
+    def submit(self, survey, answers):
+        return self.client.post('/api/survey-responses/', {'survey': survey.id, 'answers': answers}, format='json')
+
+
+class StorageModeTests(SurveyTestCase):
+    TEXTS = ['', None, 'héllo', 'ok']
+
+    def submit_all(self, storage_mode):
+        survey, choice_question, text_question, choices = self.create_survey(storage_mode)
+        for i in range(12):
+            answers = [{'question': choice_question.id, 'selected_choices': choices[:i % 4]}]
+            if self.TEXTS[i % 4] is not None:
+                answers.append({'question': text_question.id, 'text_answer': self.TEXTS[i % 4]})
+            self.assertEqual(self.submit(survey, answers).status_code, 201)
+        return survey
+
+    def summary(self, survey):
+        """Storage-independent view of a survey's results and responses: questions and choices by position."""
+        results = tally_results(survey)
+        questions = [
+            (result['text_answers'], list(result['choices'].values()))
+            for _, result in sorted(results['questions'].items())
+        ]
+        response = self.client.get(f'/api/survey-responses/?survey={survey.id}')
+        question_ids = sorted(results['questions'])
+        choice_ids = sorted(choice for result in results['questions'].values() for choice in result['choices'])
+        answers = sorted(
+            (question_ids.index(answer['question']), answer['text_answer'], tuple(choice_ids.index(c) for c in answer['selected_choices']))
+            for item in response.data for answer in item['answers']
+        )
+        return results['responses'], questions, answers
+
+    def test_compact_and_row_storage_agree(self):
+        rows = self.summary(self.submit_all('rows'))
+        compact = self.summary(self.submit_all('compact'))
+        self.assertEqual(rows, compact)
+        self.assertEqual(rows[0], 12)
+        self.assertEqual(rows[1][0], (0, [9, 6, 3]))
+        self.assertEqual(rows[1][1], (6, []))
+
+    def test_archive_keeps_results(self):
+        survey = self.submit_all('rows')
+        survey.storage_mode = 'compact'
+        survey.save()
+        choice_question = Question.objects.filter(survey=survey).order_by('id').first()
+        self.submit(survey, [{'question': choice_question.id, 'selected_choices': [choice_question.choice_set.first().id]}])
+        before = self.summary(survey)
+
+        self.assertEqual(archive_survey(survey), 13)
+        survey.refresh_from_db()
+        self.assertFalse(survey.surveyresponse_set.exists())
+        self.assertEqual(self.summary(survey), before)
+        self.assertEqual(len(archived_responses(survey)), 13)
+
+    def test_choices_of_other_questions_are_rejected(self):
+        for storage_mode in ['rows', 'compact']:
+            survey, choice_question, text_question, choices = self.create_survey(storage_mode)
+            response = self.submit(survey, [{'question': text_question.id, 'selected_choices': [choices[0]]}])
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('selected_choices', response.data)
+            self.assertFalse(survey.surveyresponse_set.exists())
+
+
+@override_settings(REST_FRAMEWORK={
+    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',),
+    'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticated',),
+    'DEFAULT_THROTTLE_RATES': {
+        'organization_submissions': '100/min',
+        'survey_submissions': '2/min',
+        'organization_analyzer': '100/min',
+    },
+})
+class SubmissionThrottleTests(SurveyTestCase):
+    def test_over_the_limit_is_refused_with_retry_after(self):
+        survey, choice_question, _, choices = self.create_survey()
+        answers = [{'question': choice_question.id, 'selected_choices': [choices[0]]}]
+        self.assertEqual(self.submit(survey, answers).status_code, 201)
+        self.assertEqual(self.submit(survey, answers).status_code, 201)
+
+        response = self.submit(survey, answers)
+        self.assertEqual(response.status_code, 429)
+        # 2/min refills a token every 30 seconds
+        self.assertTrue(0 < int(response['Retry-After']) <= 30)
+        self.assertEqual(survey.surveyresponse_set.count(), 2)
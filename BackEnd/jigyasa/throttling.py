@@ -0,0 +1,196 @@
+"""
+Token-bucket rate limits per organization and per survey.
+
+Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] in DRF's
+'<requests>/<period>' form: a bucket holds <requests> tokens and refills at
+<requests> per <period>. Buckets are kept in Django's default (local memory)
+cache, so limits are per process. DRF turns a refusal into a 429 response
+with a Retry-After header.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .models import Survey
+
+_bucket_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(lambda: {'allowed': 0, 'shed': 0, 'buckets': set()})
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def __init__(self):
+        self.capacity, self.refill_rate = self.parse_rate(self.get_rate())
+        self.wait_seconds = None
+
+    def get_rate(self):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+
+    @staticmethod
+    def parse_rate(rate):
+        num, period = rate.split('/')
+        capacity = int(num)
+        return capacity, capacity / PERIODS[period[0]]
+
+    def get_bucket_ident(self, request, view):
+        """Return the bucket this request draws from, or None to skip the limit."""
+        raise NotImplementedError('.get_bucket_ident() must be overridden')
+
+    def cache_key(self, ident):
+        return f'throttle_bucket_{self.scope}_{ident}'
+
+    def allow_request(self, request, view):
+        ident = self.get_bucket_ident(request, view)
+        if ident is None:
+            return True
+
+        now = time.time()
+        with _bucket_lock:
+            tokens = self.current_tokens(ident, now)
+            allowed = tokens >= 1
+            if allowed:
+                self.store_tokens(ident, tokens - 1, now)
+
+        self.wait_seconds = None if allowed else self.refill_wait(tokens)
+        self.record(ident, allowed)
+        return allowed
+
+    def current_tokens(self, ident, now):
+        tokens, updated = cache.get(self.cache_key(ident), (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.refill_rate)
+
+    def store_tokens(self, ident, tokens, now):
+        # Drop full buckets from the cache once they would have refilled anyway
+        cache.set(self.cache_key(ident), (tokens, now), math.ceil(self.capacity / self.refill_rate) + 1)
+
+    def refill_wait(self, tokens):
+        return (1 - tokens) / self.refill_rate
+
+    def record(self, ident, allowed):
+        with _metrics_lock:
+            metrics = _metrics[self.scope]
+            metrics['allowed' if allowed else 'shed'] += 1
+            metrics['buckets'].add(ident)
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def organization_ident(organization_id, user_id):
+    # Users and surveys without an organization are limited on their own
+    return f'org-{organization_id}' if organization_id else f'user-{user_id}'
+
+
+class SubmissionThrottle(TokenBucketThrottle):
+    def get_survey(self, request):
+        if not hasattr(request, '_throttle_survey'):
+            survey_id = request.data.get('survey')
+            request._throttle_survey = Survey.objects.filter(id=survey_id).values(
+                'id', 'organization_id', 'creator_id'
+            ).first() if str(survey_id).isdigit() else None
+        return request._throttle_survey
+
+
+class OrganizationSubmissionThrottle(SubmissionThrottle):
+    scope = 'organization_submissions'
+
+    def get_bucket_ident(self, request, view):
+        survey = self.get_survey(request)
+        if survey is None:
+            return None
+        return organization_ident(survey['organization_id'], survey['creator_id'])
+
+
+class SurveySubmissionThrottle(SubmissionThrottle):
+    scope = 'survey_submissions'
+
+    def get_bucket_ident(self, request, view):
+        survey = self.get_survey(request)
+        return f"survey-{survey['id']}" if survey else None
+
+
+class CombinedSubmissionThrottle(BaseThrottle):
+    """Organization and survey limits for submissions, taking a token from each bucket only when both have one.
+
+    Listing the two throttles separately in throttle_classes would spend the
+    organization's token on submissions the survey bucket then refuses, so a
+    single busy survey would drain its organization's budget.
+    """
+    throttle_classes = [OrganizationSubmissionThrottle, SurveySubmissionThrottle]
+
+    def __init__(self):
+        self.throttles = [throttle_class() for throttle_class in self.throttle_classes]
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        buckets = [(throttle, throttle.get_bucket_ident(request, view)) for throttle in self.throttles]
+        buckets = [(throttle, ident) for throttle, ident in buckets if ident is not None]
+        now = time.time()
+        with _bucket_lock:
+            tokens = [throttle.current_tokens(ident, now) for throttle, ident in buckets]
+            allowed = all(count >= 1 for count in tokens)
+            if allowed:
+                for (throttle, ident), count in zip(buckets, tokens):
+                    throttle.store_tokens(ident, count - 1, now)
+
+        waits = [throttle.refill_wait(count) for (throttle, _), count in zip(buckets, tokens) if count < 1]
+        self.wait_seconds = max(waits) if waits else None
+        for (throttle, ident), count in zip(buckets, tokens):
+            # Only the buckets that refused count a shed request
+            if allowed or count < 1:
+                throttle.record(ident, allowed)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class OrganizationAnalyzerThrottle(TokenBucketThrottle):
+    scope = 'organization_analyzer'
+
+    def get_bucket_ident(self, request, view):
+        user = request.user
+        if not user.is_authenticated:
+            return None
+        profile = getattr(user, 'profile', None)
+        return organization_ident(profile.organization_id if profile else None, user.id)
+
+
+THROTTLES = [OrganizationSubmissionThrottle, SurveySubmissionThrottle, OrganizationAnalyzerThrottle]
+
+
+def throttle_metrics():
+    """Request counts and current bucket utilization (0 = idle, 1 = exhausted) per scope."""
+    throttles = {cls.scope: cls() for cls in THROTTLES}
+    now = time.time()
+    results = {}
+    with _metrics_lock:
+        for scope, metrics in _metrics.items():
+            throttle = throttles[scope]
+            buckets = {}
+            for ident in list(metrics['buckets']):
+                if cache.get(throttle.cache_key(ident)) is None:
+                    # Bucket expired, so it is full again
+                    metrics['buckets'].discard(ident)
+                    continue
+                buckets[ident] = round(1 - throttle.current_tokens(ident, now) / throttle.capacity, 3)
+            results[scope] = {
+                'rate': throttle.get_rate(),
+                'allowed': metrics['allowed'],
+                'shed': metrics['shed'],
+                'utilization': buckets,
+            }
+    return results
@@ -9,7 +9,8 @@ from .views import (
     SurveyDetailView,
     SurveyViewSet,
     SurveyResponseViewSet,
-    OrganizationViewSet
+    OrganizationViewSet,
+    RateLimitMetricsView
 )
 
 router = DefaultRouter()
@@ -24,5 +25,6 @@ urlpatterns = [
     path('auth/profile/', UserProfileView.as_view(), name='profile'),
     path('create-survey/', SurveyCreateView.as_view(), name='create-survey'),
     path('survey/<int:id>/', SurveyDetailView.as_view(), name='survey-detail'),
+    path('rate-limits/', RateLimitMetricsView.as_view(), name='rate-limits'),
     path('', include(router.urls)),
 ]
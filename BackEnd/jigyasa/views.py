@@ -1,14 +1,21 @@
-from rest_framework import status, generics, viewsets, permissions
+from rest_framework import status, generics, viewsets, serializers
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.contrib.auth import get_user_model
 from .serializers import UserSerializer, RegisterSerializer, SurveySerializer, QuestionSerializer, ChoiceSerializer, SurveyResponseSerializer, OrganizationSerializer, UserProfileSerializer
-from .models import Survey, Question, Choice, SurveyResponse, Answer, Organization, UserProfile
+from .models import Survey, Question, SurveyResponse, Organization, UserProfile
+from .storage import save_response, tally_results, archived_responses
+from .live import publish_submission, event_stream, EventStreamRenderer, LiveResultsToken, LiveTokenAuthentication
+from .throttling import CombinedSubmissionThrottle, throttle_metrics
+from .routers import AnalyticsReadMixin
 from rest_framework.decorators import api_view, action
 from rest_framework.generics import RetrieveAPIView
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
 # from jigyasa_survey.models import Survey, Question  # Replace with your actual app name
 
 User = get_user_model()
@@ -81,9 +88,10 @@ class OrganizationViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
-class SurveyViewSet(viewsets.ModelViewSet):
+class SurveyViewSet(AnalyticsReadMixin, viewsets.ModelViewSet):
     serializer_class = SurveySerializer
     permission_classes = [IsAuthenticated]
+    analytics_actions = ('results',)
 
     def get_queryset(self):
         user = self.request.user
@@ -149,7 +157,29 @@ class SurveyViewSet(viewsets.ModelViewSet):
         
         return Response(survey_data)
 
-class SurveyResponseViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        survey = self.get_object()
+        return Response(tally_results(survey))
+
+    @action(detail=True, methods=['post'], url_path='live-token')
+    def live_token(self, request, pk=None):
+        survey = self.get_object()
+        token = LiveResultsToken.for_survey(request.user, survey)
+        return Response({'token': str(token), 'expires_in': int(token.lifetime.total_seconds())})
+
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer],
+            authentication_classes=[LiveTokenAuthentication, JWTAuthentication])
+    def live(self, request, pk=None):
+        survey = self.get_object()
+        if isinstance(request.auth, LiveResultsToken) and request.auth['survey'] != survey.id:
+            return Response({'error': 'This token is for another survey.'}, status=status.HTTP_403_FORBIDDEN)
+        response = StreamingHttpResponse(event_stream(survey), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class SurveyResponseViewSet(AnalyticsReadMixin, viewsets.ModelViewSet):
     serializer_class = SurveyResponseSerializer
     permission_classes = [IsAuthenticated]
 
@@ -172,6 +202,22 @@ class SurveyResponseViewSet(viewsets.ModelViewSet):
             'answer_set__question'
         )
 
+    def get_throttles(self):
+        if self.action == 'create':
+            return [CombinedSubmissionThrottle()]
+        return super().get_throttles()
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+
+        # Responses of archived surveys live in the archive file, not in the database
+        survey_id = request.query_params.get('survey')
+        if survey_id:
+            survey = Survey.objects.filter(id=survey_id).first()
+            if survey and survey.archive:
+                response.data = archived_responses(survey) + list(response.data)
+        return response
+
     def create(self, request, *args, **kwargs):
         survey_id = request.data.get('survey')
         try:
@@ -198,21 +244,8 @@ class SurveyResponseViewSet(viewsets.ModelViewSet):
             
             # Ensure answers are properly linked to the survey
             answers_data = request.data.pop('answers', [])
-            response = SurveyResponse.objects.create(survey=survey, respondent=request.user)
-            
-            for answer_data in answers_data:
-                question_id = answer_data.get('question')
-                question = Question.objects.get(id=question_id, survey=survey)
-                selected_choices = answer_data.get('selected_choices', [])
-                text_answer = answer_data.get('text_answer', None)
-                
-                answer = Answer.objects.create(
-                    response=response,
-                    question=question,
-                    text_answer=text_answer
-                )
-                if selected_choices:
-                    answer.selected_choices.set(selected_choices)
+            response = save_response(survey, request.user, answers_data)
+            publish_submission(response, answers_data)
             
             print("Survey response data:", {
                 "survey": response.survey.id,
@@ -227,8 +260,16 @@ class SurveyResponseViewSet(viewsets.ModelViewSet):
                 {"detail": "Survey not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {"detail": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+class RateLimitMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(throttle_metrics())
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -101,6 +102,20 @@ DATABASES = {
     }
 }
 
+# Optional read-only connection for analytics views (see jigyasa/routers.py).
+# Point it at a replica, or locally at a copy of db.sqlite3.
+if os.environ.get('ANALYTICS_DATABASE_NAME'):
+    DATABASES['analytics'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['ANALYTICS_DATABASE_NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['jigyasa.routers.AnalyticsRouter']
+
+# How long a user's analytics reads stay on 'default' after they write
+ANALYTICS_READ_YOUR_WRITES_SECONDS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -153,6 +168,18 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Token-bucket limits, see jigyasa/throttling.py
+    'DEFAULT_THROTTLE_RATES': {
+        'organization_submissions': '600/min',
+        'survey_submissions': '300/min',
+        'organization_analyzer': '120/min',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
 }
 
 from datetime import timedelta
@@ -177,3 +204,23 @@ SIMPLE_JWT = {
 }
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Parsed CSV uploads kept in memory per process (survey_analyzer/cache.py)
+ANALYZER_DATAFRAME_CACHE_BYTES = 512 * 1024 * 1024
+# Threads per process for background analyzer jobs (survey_analyzer/jobs.py)
+ANALYZER_JOB_WORKERS = 2
+# Seconds a job may stay pending or processing before it is presumed lost (e.g. to a restart) and resubmitted
+ANALYZER_JOB_TIMEOUT = 30 * 60
+# Worker processes for CPU-bound job steps: drawing report plots and rendering PDFs (survey_analyzer/rendering.py)
+ANALYZER_PROCESS_WORKERS = os.cpu_count() or 2
+# Persistent, content-addressed cache of plot and group-by results (survey_analyzer/results.py)
+ANALYZER_RESULT_CACHE_PATH = BASE_DIR / 'analyzer_results.sqlite3'
+ANALYZER_RESULT_CACHE_BYTES = 256 * 1024 * 1024
+# Threads per request for computing the plots of a batch (plot-data/batch/)
+ANALYZER_BATCH_WORKERS = 4
+# Working memory for CSV conversion and chunked analysis of large uploads (survey_analyzer/columnar.py)
+ANALYZER_MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+
+# Live survey results (Server-Sent Events)
+LIVE_RESULTS_BROKER = 'jigyasa.live.LocalBroker'
+LIVE_RESULTS_KEEPALIVE = 15  # seconds between keepalive comments
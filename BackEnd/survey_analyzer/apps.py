@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SurveyAnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'survey_analyzer'
+
+    def ready(self):
+        from . import signals  # noqa: F401
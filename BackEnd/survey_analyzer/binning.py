@@ -0,0 +1,106 @@
+"""
+Server-side binning for histogram and heatmap plots.
+
+Histograms are computed with numpy and only bin edges and counts are sent to
+the browser. With chunk_size set, counts are accumulated chunk by chunk over
+the (memory-mapped) column so large files are never copied in full. Heatmap
+grids are aggregated with np.bincount over combined cell codes, so the payload
+depends on the grid size rather than the row count.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+# Upper bound on values used to estimate a bin width in chunked mode
+WIDTH_SAMPLE_SIZE = 1_000_000
+MAX_BINS = 10_000
+# Cells per heatmap axis for columns that are not binned
+MAX_GRID_CATEGORIES = 500
+
+
+def bin_edges(values, bins, bin_width, value_range, chunk_size=None):
+    low, high = value_range
+    if bin_width:
+        start = math.floor(low / bin_width) * bin_width
+        count = max(math.ceil((high - start) / bin_width), 1)
+        if count > MAX_BINS:
+            raise ValueError(f"bin_width gives {count} bins; at most {MAX_BINS} are allowed.")
+        return start + np.arange(count + 1) * bin_width
+
+    if isinstance(bins, int):
+        return np.histogram_bin_edges(np.empty(0), bins=bins, range=(low, high))
+
+    if chunk_size and len(values) > WIDTH_SAMPLE_SIZE:
+        # Estimate the width from an evenly strided sample, then cover the full range
+        sample = values[::math.ceil(len(values) / WIDTH_SAMPLE_SIZE)].astype(float)
+        sample = sample[~np.isnan(sample)]
+        sample_edges = np.histogram_bin_edges(sample, bins=bins)
+        if len(sample_edges) < 2 or sample_edges[1] <= sample_edges[0]:
+            return np.histogram_bin_edges(np.empty(0), bins=1, range=(low, high))
+        return bin_edges(values, None, sample_edges[1] - sample_edges[0], value_range)
+
+    finite = values.astype(float)
+    return np.histogram_bin_edges(finite[~np.isnan(finite)], bins=bins, range=(low, high))
+
+
+def histogram(values, bins='auto', bin_width=None, value_range=None, chunk_size=None):
+    """Return (edges, counts) for a numeric array, ignoring missing values."""
+    if value_range is None or None in value_range:
+        finite = values.astype(float)
+        finite = finite[~np.isnan(finite)]
+        if not len(finite):
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        value_range = (finite.min(), finite.max())
+
+    edges = bin_edges(values, bins, bin_width, value_range, chunk_size)
+    if len(edges) - 1 > MAX_BINS:
+        raise ValueError(f"Histogram would have {len(edges) - 1} bins; at most {MAX_BINS} are allowed.")
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    step = chunk_size or len(values) or 1
+    for start in range(0, len(values), step):
+        chunk = values[start:start + step].astype(float)
+        counts += np.histogram(chunk[~np.isnan(chunk)], bins=edges)[0]
+    return edges, counts
+
+
+def grid_axis(values, size, value_range, distinct_count):
+    """(codes, labels) placing each value of a Series on one axis of a heatmap grid.
+
+    Numeric columns with more than size distinct values are cut into size
+    equal-width bins labelled by their centres; other columns keep one cell per
+    value. Missing values get code -1.
+    """
+    if is_numeric_dtype(values.dtype) and not is_bool_dtype(values.dtype) and distinct_count > size:
+        edges = np.histogram_bin_edges(np.empty(0), bins=size, range=value_range)
+        array = values.to_numpy(dtype=float)
+        codes = np.clip(np.searchsorted(edges, array, side='right') - 1, 0, size - 1)
+        codes[np.isnan(array)] = -1
+        return codes, ((edges[:-1] + edges[1:]) / 2).tolist()
+
+    codes, uniques = pd.factorize(values, sort=True)
+    if len(uniques) > MAX_GRID_CATEGORIES:
+        raise ValueError(f"{values.name} has {len(uniques)} distinct values; at most {MAX_GRID_CATEGORIES} can be plotted.")
+    return codes, uniques.tolist()
+
+
+def grid_aggregate(x_codes, y_codes, shape, aggregate='count', values=None):
+    """Rows x columns list of the count, mean or sum of values per grid cell, None for empty cells."""
+    columns, rows = shape
+    present = (x_codes >= 0) & (y_codes >= 0)
+    if values is not None:
+        values = np.asarray(values, dtype=float)
+        present &= ~np.isnan(values)
+    cells = y_codes[present].astype(np.int64) * columns + x_codes[present]
+    counts = np.bincount(cells, minlength=columns * rows)
+
+    if aggregate == 'count':
+        return counts.reshape(rows, columns).tolist()
+
+    z = np.bincount(cells, weights=values[present], minlength=columns * rows)
+    if aggregate == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = z / counts
+    z[counts == 0] = np.nan
+    return [[None if np.isnan(cell) else cell for cell in row] for row in z.reshape(rows, columns).tolist()]
@@ -0,0 +1,151 @@
+"""
+Process-level cache of loaded CSV upload columns.
+
+Columns are read from the upload's columnar sidecar (see columnar.py) and
+cached per column, keyed by (stored file name, file mtime, file size,
+column), so a replaced file is loaded again and uploads sharing a stored
+file (see uploads.py) share its columns. Entries are evicted least-recently-used
+once they exceed ANALYZER_DATAFRAME_CACHE_BYTES. Cached data is shared
+between requests and must not be modified in place.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from django.conf import settings
+
+from . import columnar
+from .filters import build_mask, filter_key
+
+
+class UploadNotReady(Exception):
+    pass
+
+
+class DataFrameCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (dataframe, size in bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> lock, so concurrent misses parse a file only once
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+            try:
+                df = loader()
+                self.put(key, df)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return df
+
+    def put(self, key, df):
+        if isinstance(df, pd.DataFrame):
+            size = int(df.memory_usage(deep=True).sum())
+        elif isinstance(df, pd.Series):
+            size = int(df.memory_usage(deep=True))
+        else:
+            size = df.nbytes  # filter masks
+        with self._lock:
+            # Drop entries for older versions of the file too
+            for stale in [stale for stale in self._entries if stale[0] == key[0] and stale[1:3] != key[1:3]]:
+                self._bytes -= self._entries.pop(stale)[1]
+            if size > self.max_bytes:
+                return
+            while self._entries and self._bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (df, size)
+            self._bytes += size
+
+    def invalidate(self, file_name):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == file_name]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+            }
+
+
+dataframe_cache = DataFrameCache(getattr(settings, 'ANALYZER_DATAFRAME_CACHE_BYTES', 512 * 1024 * 1024))
+
+
+def upload_cache_key(csv_upload):
+    stat = os.stat(csv_upload.file.path)
+    return (csv_upload.file.name, stat.st_mtime_ns, stat.st_size)
+
+
+def check_ready(csv_upload):
+    if csv_upload.status in ('pending', 'processing'):
+        # Imported here: jobs imports this module through profiling
+        from .jobs import resume_lost_upload
+        resume_lost_upload(csv_upload)
+        raise UploadNotReady("File is still being processed.")
+    if csv_upload.status == 'failed':
+        raise UploadNotReady(f"File could not be processed: {csv_upload.processing_error}")
+
+
+def filter_mask(csv_upload, meta, filters):
+    """Boolean row mask for filters (see filters.py), cached per file version and filter."""
+    key = upload_cache_key(csv_upload) + ('filter', filter_key(filters))
+    return dataframe_cache.get_or_load(key, lambda: build_mask(csv_upload, meta, filters))
+
+
+def load_dataframe(csv_upload, columns=None, filters=None):
+    """DataFrame with the given columns of an upload (all when None), from the cache when possible.
+
+    Columns the upload does not have are left out, so callers can keep
+    validating names against df.columns. With filters, only matching rows
+    are returned.
+    """
+    check_ready(csv_upload)
+    meta = columnar.ensure_sidecar(csv_upload)
+    available = [column['name'] for column in meta['columns']]
+    names = available if columns is None else [name for name in dict.fromkeys(columns) if name in available]
+
+    key = upload_cache_key(csv_upload)
+    data = {
+        name: dataframe_cache.get_or_load(key + (name,), lambda name=name: columnar.load_column(csv_upload, meta, name))
+        for name in names
+    }
+    df = pd.DataFrame(data, copy=False) if data else pd.DataFrame(index=pd.RangeIndex(meta['rows']))
+    return filter_dataframe(csv_upload, df, filters, meta)
+
+
+def filter_dataframe(csv_upload, df, filters, meta=None):
+    """Rows of a full-length DataFrame of an upload that match filters."""
+    if not filters:
+        return df
+    mask = filter_mask(csv_upload, meta or columnar.ensure_sidecar(csv_upload), filters)
+    return df[mask].reset_index(drop=True)
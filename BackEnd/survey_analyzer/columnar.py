@@ -0,0 +1,310 @@
+"""
+Columnar sidecars for CSV uploads.
+
+Each upload is converted once into a '<file>.columns' directory holding one
+.npy file per column and a meta.json. Numeric and boolean columns are stored
+as-is and memory-mapped on load; text columns are dictionary-encoded as int32
+codes (-1 for missing) plus a JSON list of categories. Requests then read only
+the columns they use instead of re-parsing the whole CSV.
+
+Conversion streams the CSV in chunks sized by ANALYZER_MEMORY_BUDGET_BYTES,
+and iter_chunks() reads columns back in row slices, so neither needs the whole
+file in memory. Numeric columns also store min, max and null counts per block
+of BLOCK_ROWS rows, so filters can skip blocks without reading them.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from pandas.api.types import infer_dtype, is_bool_dtype, is_integer_dtype, is_numeric_dtype
+
+SIDECAR_VERSION = 3
+# Rows per block for the block statistics stored with numeric columns
+BLOCK_ROWS = 65_536
+# Bytes of working memory a conversion or chunked computation may use
+MEMORY_BUDGET = getattr(settings, 'ANALYZER_MEMORY_BUDGET_BYTES', 256 * 1024 * 1024)
+PARSED_BYTES_FACTOR = 8
+# Content-addressed store of uploads (see uploads.py)
+CONTENT_DIR = os.path.join('uploads', 'csv', 'sha256')
+
+
+def sidecar_path(csv_upload):
+    return f'{csv_upload.file.path}.columns'
+
+
+def source_signature(file_path):
+    stat = os.stat(file_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def content_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_name(sha256):
+    return os.path.join(CONTENT_DIR, f'{sha256}.csv')
+
+
+def known_hash(csv_upload):
+    """The upload's SHA-256 if it is known without reading the file, else None.
+
+    Files in the content-addressed store are named by the hash computed while
+    they were uploaded and never rewritten; older uploads may have been.
+    """
+    if csv_upload.content_hash and csv_upload.file.name == content_name(csv_upload.content_hash):
+        return csv_upload.content_hash
+    return None
+
+
+def csv_chunk_rows(file_path, budget):
+    """Rows per read_csv chunk so a parsed chunk stays well within budget bytes."""
+    with open(file_path, 'rb') as f:
+        sample = f.read(1024 * 1024)
+    line_bytes = len(sample) / max(sample.count(b'\n'), 1)
+    # Parsed values take several times the space of their CSV text
+    return max(int(budget // (line_bytes * PARSED_BYTES_FACTOR)), 1000)
+
+
+def chunk_kind(series):
+    if series.isna().all():
+        return None
+    if is_bool_dtype(series.dtype):
+        return 'b'
+    if is_integer_dtype(series.dtype):
+        return 'i'
+    if is_numeric_dtype(series.dtype):
+        return 'f'
+    return 'O' if infer_dtype(series, skipna=True) == 'string' else 'mixed'
+
+
+def block_statistics(array):
+    """Per-block min, max and null count of a numeric column, used to skip blocks when filtering."""
+    minimums, maximums, nulls = [], [], []
+    for start in range(0, len(array), BLOCK_ROWS):
+        block = np.asarray(array[start:start + BLOCK_ROWS])
+        if block.dtype.kind == 'f':
+            missing = np.isnan(block)
+            block = block[~missing]
+            nulls.append(int(missing.sum()))
+        else:
+            nulls.append(0)
+        minimums.append(block.min().item() if len(block) else None)
+        maximums.append(block.max().item() if len(block) else None)
+    return {'block_min': minimums, 'block_max': maximums, 'block_nulls': nulls}
+
+
+def combine_kinds(a, b):
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if {a, b} == {'i', 'f'}:
+        return 'f'
+    # Booleans mixed with anything else, or text mixed with numbers, stay mixed like a full read
+    return 'mixed'
+
+
+def convert_csv(file_path, budget, sha256=None):
+    """Write the sidecar for a CSV, streaming it in chunks that fit in budget bytes.
+
+    The first pass infers each column's type across all chunks the same way a
+    single read_csv would; the second writes the columns into preallocated
+    .npy files, dictionary-encoding text against categories shared by all chunks.
+    """
+    chunk_rows = csv_chunk_rows(file_path, budget)
+    names = [str(name) for name in pd.read_csv(file_path, nrows=0).columns]
+    kinds = dict.fromkeys(names)
+    missing = dict.fromkeys(names, False)
+    text_dtypes = {}
+    rows = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunk_rows):
+        rows += len(chunk)
+        for name in names:
+            series = chunk[name]
+            kind = chunk_kind(series)
+            kinds[name] = combine_kinds(kinds[name], kind)
+            missing[name] = missing[name] or bool(series.hasnans)
+            if kind == 'O':
+                text_dtypes.setdefault(name, str(series.dtype))
+    for name in names:
+        if kinds[name] is None:
+            kinds[name] = 'f'  # all missing, read as float64
+        elif missing[name] and kinds[name] in ('i', 'b'):
+            kinds[name] = 'f' if kinds[name] == 'i' else 'mixed'
+
+    numeric_dtypes = {'b': 'bool', 'i': 'int64', 'f': 'float64'}
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(file_path), prefix='.columns-')
+    try:
+        columns = []
+        arrays = {}
+        categories = {}
+        for i, name in enumerate(names):
+            entry = {'name': name, 'file': f'{i}.npy'}
+            if kinds[name] in numeric_dtypes:
+                entry.update(kind='numeric', dtype=numeric_dtypes[kinds[name]])
+            elif kinds[name] == 'O':
+                entry.update(kind='categorical', dtype=text_dtypes[name], categories=f'{i}.categories.json')
+                categories[name] = {}
+            else:
+                # Mixed value types; such columns are read from the CSV when needed
+                entry.update(kind='csv', dtype='object')
+            if entry['kind'] != 'csv':
+                dtype = np.int32 if entry['kind'] == 'categorical' else entry['dtype']
+                arrays[name] = np.lib.format.open_memmap(os.path.join(tmp, entry['file']), mode='w+', dtype=dtype, shape=(rows,))
+            columns.append(entry)
+
+        if arrays and rows:
+            dtypes = {name: numeric_dtypes[kinds[name]] for name in arrays if kinds[name] in numeric_dtypes}
+            offset = 0
+            for chunk in pd.read_csv(file_path, chunksize=chunk_rows, usecols=list(arrays), dtype=dtypes):
+                for name, array in arrays.items():
+                    if name in categories:
+                        codes, uniques = pd.factorize(chunk[name])
+                        known = categories[name]
+                        mapping = np.array([known.setdefault(value, len(known)) for value in uniques], dtype=np.int32)
+                        array[offset:offset + len(chunk)] = np.where(codes >= 0, mapping[np.maximum(codes, 0)], -1) if len(mapping) else -1
+                    else:
+                        array[offset:offset + len(chunk)] = chunk[name].to_numpy()
+                offset += len(chunk)
+        for entry in columns:
+            if entry['kind'] == 'numeric':
+                entry.update(block_statistics(arrays[entry['name']]))
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+        for entry in columns:
+            if entry['kind'] == 'categorical':
+                with open(os.path.join(tmp, entry['categories']), 'w') as f:
+                    json.dump(list(categories[entry['name']]), f)
+
+        meta = {
+            'version': SIDECAR_VERSION,
+            'source': source_signature(file_path),
+            # Hashing reads the whole file again, so a hash known from the upload is used instead
+            'sha256': sha256 or content_hash(file_path),
+            'rows': rows,
+            'block_rows': BLOCK_ROWS,
+            'columns': columns,
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        path = f'{file_path}.columns'
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another request finished converting the same file first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return meta
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def read_meta(csv_upload):
+    """Sidecar metadata, or None if the sidecar is missing or out of date."""
+    try:
+        with open(os.path.join(sidecar_path(csv_upload), 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != SIDECAR_VERSION or meta.get('source') != source_signature(csv_upload.file.path):
+        return None
+    return meta
+
+
+def ensure_sidecar(csv_upload, budget=MEMORY_BUDGET):
+    """Sidecar metadata, converting the upload first if needed (e.g. older uploads)."""
+    meta = read_meta(csv_upload)
+    if meta is None:
+        meta = convert_csv(csv_upload.file.path, budget, known_hash(csv_upload))
+    return meta
+
+
+def load_column(csv_upload, meta, name):
+    entry = next(column for column in meta['columns'] if column['name'] == name)
+    path = sidecar_path(csv_upload)
+
+    if entry['kind'] == 'numeric':
+        # A plain ndarray view of the mapping, so pages are only read when touched
+        values = np.load(os.path.join(path, entry['file']), mmap_mode='r').view(np.ndarray)
+        return pd.Series(values, name=name, copy=False)
+
+    if entry['kind'] == 'categorical':
+        codes = np.load(os.path.join(path, entry['file']))
+        with open(os.path.join(path, entry['categories'])) as f:
+            categories = json.load(f)
+        values = pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype=object))
+        return pd.Series(values, name=name).astype(entry['dtype'])
+
+    return pd.read_csv(csv_upload.file.path, usecols=[name])[name]
+
+
+def row_bytes(meta, columns):
+    entries = {column['name']: column for column in meta['columns']}
+    sizes = {'numeric': 8, 'categorical': 4, 'csv': 64}
+    return sum(sizes[entries[name]['kind']] for name in columns) or 1
+
+
+def chunk_rows(meta, columns, budget=MEMORY_BUDGET):
+    """Rows per chunk so a chunk of these columns, and the work done on it, fits in budget bytes."""
+    return max(int(budget // (row_bytes(meta, columns) * PARSED_BYTES_FACTOR)), 1000)
+
+
+def chunk_size_for(csv_upload, columns):
+    """Rows per chunk when these columns of an upload don't fit the memory budget, else None."""
+    meta = ensure_sidecar(csv_upload)
+    rows = chunk_rows(meta, columns)
+    return rows if meta['rows'] > rows else None
+
+
+def iter_chunks(csv_upload, meta, columns, rows, mask=None):
+    """Yield DataFrames of the given columns, rows at a time.
+
+    Numeric columns are sliced from the memory map and text columns are kept as
+    categoricals, so each chunk only costs its own rows. With a row mask, only
+    matching rows are yielded and chunks without any are not read.
+    """
+    path = sidecar_path(csv_upload)
+    entries = {column['name']: column for column in meta['columns']}
+    sources = {}
+    for name in columns:
+        entry = entries[name]
+        if entry['kind'] == 'numeric':
+            sources[name] = np.load(os.path.join(path, entry['file']), mmap_mode='r')
+        elif entry['kind'] == 'categorical':
+            with open(os.path.join(path, entry['categories'])) as f:
+                categories = pd.Index(json.load(f), dtype=object)
+            sources[name] = (np.load(os.path.join(path, entry['file']), mmap_mode='r'), categories)
+        else:
+            sources[name] = load_column(csv_upload, meta, name).to_numpy()
+
+    for start in range(0, meta['rows'], rows):
+        keep = mask[start:start + rows] if mask is not None else None
+        if keep is not None and not keep.any():
+            continue
+        chunk = {}
+        for name, source in sources.items():
+            if isinstance(source, tuple):
+                codes, categories = source
+                chunk[name] = pd.Categorical.from_codes(np.asarray(codes[start:start + rows]), categories=categories)
+            else:
+                chunk[name] = np.asarray(source[start:start + rows])
+        chunk = pd.DataFrame(chunk, index=pd.RangeIndex(start, min(start + rows, meta['rows'])))
+        yield chunk if keep is None else chunk[keep]
+
+
+def remove_sidecar(csv_upload):
+    shutil.rmtree(sidecar_path(csv_upload), ignore_errors=True)
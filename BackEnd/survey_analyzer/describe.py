@@ -0,0 +1,156 @@
+"""
+Descriptive statistics and correlation matrices for CSV uploads.
+
+Both cover numeric (and boolean) columns and return compact tables in
+{"index", "columns", "data"} form: one row per statistic for describe, a
+columns x columns matrix for correlations. Columns that fit
+ANALYZER_MEMORY_BUDGET_BYTES are computed in one vectorized pass over the
+cached columns; larger uploads are read in chunks:
+
+- describe accumulates counts, sums, minimum and maximum chunk by chunk and
+  finds percentiles exactly with stats.chunked_quantiles;
+- Pearson correlations accumulate pairwise sums as matrix products over
+  chunks of all columns;
+- Spearman correlations rank each column on its own into a temporary memory
+  map (stats.chunked_ranks, a chunk at a time) and correlate the ranks like
+  Pearson. Missing values are dropped per
+  column rather than per pair of columns, so with missing values the result
+  can differ slightly from the in-memory (pandas) one.
+
+Results are kept in the persistent result cache.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from .cache import load_dataframe
+from .columnar import chunk_rows, ensure_sidecar, iter_chunks, load_column
+from .results import result_cache, result_key
+from .stats import chunked_quantiles, chunked_ranks, finite_chunks
+
+METHODS = ['pearson', 'spearman']
+DEFAULT_PERCENTILES = [25, 50, 75]
+
+
+def numeric_columns(meta):
+    return [column['name'] for column in meta['columns'] if column['kind'] == 'numeric']
+
+
+def json_matrix(matrix):
+    return [[None if np.isnan(value) else float(value) for value in row] for row in np.asarray(matrix, dtype=float)]
+
+
+def describe_values(values, percentiles, chunk_size=None):
+    """[count, mean, std, min, *percentiles, max] of an array's non-missing values."""
+    count = 0
+    shift = total = squares = 0.0
+    low, high = np.inf, -np.inf
+    for chunk in finite_chunks(values, chunk_size):
+        if not len(chunk):
+            continue
+        if not count:
+            shift = chunk[0]  # sums around a value from the data keep the variance accurate
+        count += len(chunk)
+        total += (chunk - shift).sum()
+        squares += np.square(chunk - shift).sum()
+        low, high = min(low, chunk.min()), max(high, chunk.max())
+    if not count:
+        return [0] + [np.nan] * (len(percentiles) + 4)
+
+    quantiles = [p / 100 for p in percentiles]
+    if chunk_size and chunk_size < len(values):
+        points = chunked_quantiles(values, quantiles, chunk_size, (low, high)) if quantiles else []
+    else:
+        points = list(np.quantile(next(finite_chunks(values)), quantiles)) if quantiles else []
+    std = np.sqrt(max(squares - total ** 2 / count, 0.0) / (count - 1)) if count > 1 else np.nan
+    return [count, shift + total / count, std, low, *points, high]
+
+
+def describe(csv_upload, columns, percentiles=None):
+    """describe()-style table of count, mean, std, min, percentiles and max per column."""
+    percentiles = DEFAULT_PERCENTILES if percentiles is None else sorted(set(percentiles))
+    meta = ensure_sidecar(csv_upload)
+    rows = chunk_rows(meta, columns)
+    if meta['rows'] <= rows:
+        df = load_dataframe(csv_upload, columns)
+        table = [describe_values(df[name].to_numpy(), percentiles) for name in columns]
+    else:
+        table = [describe_values(load_column(csv_upload, meta, name).to_numpy(), percentiles, rows) for name in columns]
+
+    index = ['count', 'mean', 'std', 'min', *(f'{p:g}%' for p in percentiles), 'max']
+    data = json_matrix(np.array(table, dtype=float).T)
+    data[0] = [int(value) for value in data[0]]
+    return {'index': index, 'columns': columns, 'data': data}
+
+
+def pearson_chunks(blocks, size):
+    """Pairwise-complete Pearson correlation matrix from 2-D float blocks (rows x size columns, NaN for missing)."""
+    n = np.zeros((size, size))
+    sums = np.zeros((size, size))
+    squares = np.zeros((size, size))
+    products = np.zeros((size, size))
+    shift = None
+    for block in blocks:
+        present = ~np.isnan(block)
+        if shift is None and len(block):
+            # Sums around the first block's means keep the (co)variances accurate
+            shift = np.nansum(block, axis=0) / np.maximum(present.sum(axis=0), 1)
+        if shift is None:
+            continue
+        values = np.where(present, block - shift, 0.0)
+        weights = present.astype(float)
+        n += weights.T @ weights
+        # [i, j]: sum of column i over the rows where both i and j are present
+        sums += values.T @ weights
+        squares += np.square(values).T @ weights
+        products += values.T @ values
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = products - sums * sums.T / n
+        variance = squares - np.square(sums) / n
+        matrix = covariance / np.sqrt(variance * variance.T)
+    matrix[(n < 2) | (variance <= 0) | (variance.T <= 0)] = np.nan
+    return np.clip(matrix, -1, 1)
+
+
+def correlation(csv_upload, columns, method='pearson'):
+    """Pearson or Spearman correlation matrix of columns."""
+    meta = ensure_sidecar(csv_upload)
+    rows = chunk_rows(meta, columns)
+    if meta['rows'] <= rows:
+        matrix = load_dataframe(csv_upload, columns).astype(float).corr(method=method).to_numpy()
+    elif method == 'pearson':
+        blocks = (chunk.to_numpy(dtype=float) for chunk in iter_chunks(csv_upload, meta, columns, rows))
+        matrix = pearson_chunks(blocks, len(columns))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            ranks = []
+            for i, name in enumerate(columns):
+                array = np.lib.format.open_memmap(os.path.join(directory, f'{i}.npy'), mode='w+', dtype=np.float64, shape=(meta['rows'],))
+                chunked_ranks(load_column(csv_upload, meta, name).to_numpy(), array, rows)
+                ranks.append(array)
+            blocks = (
+                np.column_stack([np.asarray(array[start:start + rows]) for array in ranks])
+                for start in range(0, meta['rows'], rows)
+            )
+            matrix = pearson_chunks(blocks, len(columns))
+    return {'method': method, 'index': columns, 'columns': columns, 'data': json_matrix(matrix)}
+
+
+def cached_describe(csv_upload, columns, percentiles=None):
+    key = result_key(csv_upload, 'describe', [columns, percentiles])
+    result = result_cache.get(key)
+    if result is None:
+        result = describe(csv_upload, columns, percentiles)
+        result_cache.put(key, result)
+    return result
+
+
+def cached_correlation(csv_upload, columns, method='pearson'):
+    key = result_key(csv_upload, 'correlation', [columns, method])
+    result = result_cache.get(key)
+    if result is None:
+        result = correlation(csv_upload, columns, method)
+        result_cache.put(key, result)
+    return result
@@ -0,0 +1,85 @@
+"""
+Shape-preserving downsampling for scatter, line and area plots.
+
+Both methods keep the series in its original order and return row positions
+to keep, so x values of any type (numbers, dates, labels) are sent unchanged.
+
+- 'lttb' (Largest-Triangle-Three-Buckets) keeps the points that best preserve
+  the visual shape of an ordered series.
+- 'minmax' keeps the lowest and highest point of each bucket, so spikes are
+  never lost.
+"""
+import math
+
+import numpy as np
+from pandas.api.types import is_numeric_dtype
+
+
+def lttb_indices(x, y, n):
+    length = len(x)
+    if n >= length or n < 3:
+        return np.arange(length)
+
+    every = (length - 2) / (n - 2)
+    # n - 2 buckets between the first and last point: bucket i is [edges[i], edges[i + 1])
+    edges = (np.floor(np.arange(n - 1) * every) + 1).astype(np.int64)
+    edges[-1] = length - 1
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:length - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:length - 1], edges[:-1]) / counts
+
+    indices = np.empty(n, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = length - 1
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        if i < n - 3:
+            next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, n):
+    length = len(y)
+    buckets = max(n // 2, 1)
+    if n >= length:
+        return np.arange(length)
+
+    size = math.ceil(length / buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:length] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.where(np.isnan(padded), np.inf, padded).argmin(axis=1)
+    highs = offsets + np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1)
+    indices = np.unique(np.concatenate([lows, highs]))
+    return indices[indices < length]
+
+
+def downsample(x, y, max_points, method):
+    """Return (x, y) Series reduced to at most max_points rows, missing points dropped."""
+    present = x.notna() & y.notna()
+    if not present.all():
+        x, y = x[present], y[present]
+    if max_points is None or len(y) <= max_points:
+        return x, y
+
+    if not is_numeric_dtype(y.dtype):
+        # Nothing to preserve the shape of; keep evenly spaced rows
+        indices = np.linspace(0, len(y) - 1, max_points).astype(np.int64)
+    elif method == 'lttb':
+        y_values = y.to_numpy(dtype=float)
+        x_values = x.to_numpy(dtype=float) if is_numeric_dtype(x.dtype) else None
+        if x_values is None or np.any(np.diff(x_values) < 0):
+            # Not an ordered numeric axis: use row order as the x coordinate
+            x_values = np.arange(len(y), dtype=float)
+        indices = lttb_indices(x_values, y_values, max_points)
+    else:
+        indices = minmax_indices(y.to_numpy(dtype=float), max_points)
+
+    return x.iloc[indices], y.iloc[indices]
@@ -0,0 +1,128 @@
+"""
+Row filters for plot and group-by requests.
+
+A filter is a list of conditions that must all hold, e.g.
+[{"column": "region", "op": "==", "value": "North"}, {"column": "score", "op": ">", "value": 3}].
+Conditions are evaluated against the columnar sidecar as boolean masks:
+
+- numeric columns are compared block by block, and blocks whose stored
+  min/max/null statistics rule a condition out (or in) are never read;
+- text columns are compared once against their categories, then matched on
+  the int32 codes;
+- rows with a missing value only match is_null.
+
+Masks are cached per file version and filter, next to the loaded columns
+(see cache.filter_mask).
+"""
+import json
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import columnar
+
+COMPARISONS = {
+    '==': operator.eq, '!=': operator.ne,
+    '>': operator.gt, '>=': operator.ge,
+    '<': operator.lt, '<=': operator.le,
+}
+OPS = [*COMPARISONS, 'in', 'not_in', 'is_null', 'not_null']
+
+
+class FilterError(ValueError):
+    pass
+
+
+def filter_key(filters):
+    return json.dumps([[f['column'], f['op'], f.get('value')] for f in filters], sort_keys=True)
+
+
+def value_mask(values, op, value, name):
+    """Mask of non-missing values (an ndarray or Series) of column name satisfying op value."""
+    values = pd.Series(values, copy=False)
+    present = values.notna().to_numpy()
+    if op == 'is_null':
+        return ~present
+    if op == 'not_null':
+        return present
+    if op in ('in', 'not_in'):
+        matches = values.isin(value).to_numpy()
+        return present & (matches if op == 'in' else ~matches)
+    try:
+        matches = COMPARISONS[op](values, value).to_numpy(dtype=bool)
+    except TypeError:
+        raise FilterError(f"Cannot compare {name} with {value!r}.")
+    return present & matches
+
+
+def block_outcome(entry, block, op, value):
+    """True/False when the block statistics decide the condition for every row in the block, else None."""
+    low, high, nulls = entry['block_min'][block], entry['block_max'][block], entry['block_nulls'][block]
+    if op == 'is_null':
+        return False if not nulls else None
+    if op == 'not_null':
+        return True if not nulls else None
+    if low is None:
+        return False  # every value is missing
+    if op in ('in', 'not_in'):
+        numbers = [v for v in value if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if len(numbers) == len(value) and not any(low <= v <= high for v in numbers):
+            return False if op == 'in' else (True if not nulls else None)
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if op == '==' and (value < low or value > high):
+        return False
+    if (op == '>' and high <= value) or (op == '>=' and high < value) or (op == '<' and low >= value) or (op == '<=' and low > value):
+        return False
+    if not nulls and ((op == '>' and low > value) or (op == '>=' and low >= value) or (op == '<' and high < value) or (op == '<=' and high <= value)):
+        return True
+    return None
+
+
+def condition_mask(csv_upload, meta, entry, op, value, mask):
+    """AND one condition into mask, reading only rows it can still change."""
+    path = columnar.sidecar_path(csv_upload)
+    if entry['kind'] == 'categorical':
+        with open(os.path.join(path, entry['categories'])) as f:
+            categories = pd.Series(json.load(f), dtype=object)
+        codes = np.load(os.path.join(path, entry['file']), mmap_mode='r')
+        if op in ('is_null', 'not_null'):
+            mask &= (codes < 0) if op == 'is_null' else (codes >= 0)
+            return mask
+        # Decide each category once, then select rows by code
+        matching = np.flatnonzero(value_mask(categories, op, value, entry['name']))
+        mask &= np.isin(codes, matching)
+        return mask
+
+    if entry['kind'] == 'csv':
+        mask &= value_mask(columnar.load_column(csv_upload, meta, entry['name']), op, value, entry['name'])
+        return mask
+
+    values = np.load(os.path.join(path, entry['file']), mmap_mode='r')
+    block_rows = meta['block_rows']
+    for block, start in enumerate(range(0, meta['rows'], block_rows)):
+        stop = start + block_rows
+        if not mask[start:stop].any():
+            continue
+        outcome = block_outcome(entry, block, op, value)
+        if outcome is False:
+            mask[start:stop] = False
+        elif outcome is None:
+            mask[start:stop] &= value_mask(np.asarray(values[start:stop]), op, value, entry['name'])
+    return mask
+
+
+def build_mask(csv_upload, meta, filters):
+    """Boolean row mask for filters (see cache.filter_mask for the cached version)."""
+    entries = {column['name']: column for column in meta['columns']}
+    for condition in filters:
+        if condition['column'] not in entries:
+            raise FilterError(f"Invalid column in filters: {condition['column']}")
+
+    mask = np.ones(meta['rows'], dtype=bool)
+    for condition in filters:
+        condition_mask(csv_upload, meta, entries[condition['column']], condition['op'], condition.get('value'), mask)
+    return mask
@@ -0,0 +1,206 @@
+"""
+Group-by summaries for CSV uploads.
+
+Key columns are dictionary-encoded as categoricals and grouped once; every
+requested aggregation is computed from that single grouping. Aggregations are
+count, sum, mean, min, max, nunique and quantiles written as pNN (p50, p90,
+p99.9). Results are named '<column>_<aggregation>' next to a 'count' column
+holding the group size, and are kept in the persistent result cache. Uploads whose
+columns don't fit ANALYZER_MEMORY_BUDGET_BYTES are grouped chunk by chunk.
+"""
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .cache import filter_mask, load_dataframe
+from .filters import filter_key
+from .pivot import key_ids
+from .results import result_cache, result_key
+from .columnar import chunk_rows, ensure_sidecar, iter_chunks
+from .stats import chunked_quantiles, finite_chunks, scratch
+
+AGGREGATIONS = ['count', 'sum', 'mean', 'min', 'max', 'nunique']
+QUANTILE = re.compile(r'^p(100|\d{1,2}(\.\d+)?)$')
+
+
+def is_aggregation(name):
+    return name in AGGREGATIONS or bool(QUANTILE.match(name))
+
+
+def group_by(df, keys, aggregations, sort_by=None, ascending=False, limit=None):
+    """Return (number of groups, list of row dicts) for df grouped by keys.
+
+    Rows are sorted by sort_by (default: group size, largest first) and cut
+    to the first limit rows. Rows with a missing key are left out.
+    """
+    grouper = [df[key].astype('category') for key in keys]
+    grouped = df.groupby(grouper, observed=True, sort=False)
+
+    result = grouped.size().to_frame('count')
+    named = {
+        f'{column}_{name}': pd.NamedAgg(column=column, aggfunc=name)
+        for column, names in aggregations.items() for name in names if name in AGGREGATIONS
+    }
+    if named:
+        result = result.join(grouped.agg(**named))
+
+    for column, names in aggregations.items():
+        quantiles = {name: float(name[1:]) / 100 for name in names if QUANTILE.match(name)}
+        if quantiles:
+            values = grouped[column].quantile(sorted(set(quantiles.values()))).unstack()
+            result = result.join(pd.DataFrame({f'{column}_{name}': values[q] for name, q in quantiles.items()}))
+
+    return sorted_rows(result, keys, sort_by, ascending, limit)
+
+
+def group_quantiles(ids, values, groups, quantiles, chunk_size):
+    """Exact quantiles (groups x quantiles, NaN for groups without values) of values by group id.
+
+    ids and values are spilled arrays of any length, read a chunk at a time:
+    values are first scattered into group order in a scratch memory map, then
+    quantiles are taken for batches of groups that fit in one chunk, and with
+    stats.chunked_quantiles for groups that don't.
+    """
+    counts = np.zeros(groups, dtype=np.int64)
+    for start in range(0, len(ids), chunk_size):
+        counts += np.bincount(ids[start:start + chunk_size], minlength=groups)
+    starts = np.cumsum(counts) - counts
+
+    ordered = scratch(np.float64, len(ids))
+    cursors = starts.copy()
+    for start in range(0, len(ids), chunk_size):
+        chunk_ids = np.asarray(ids[start:start + chunk_size])
+        order = np.argsort(chunk_ids, kind='stable')
+        chunk_ids = chunk_ids[order]
+        chunk_counts = np.bincount(chunk_ids, minlength=groups)
+        # Place of each value among its group's values in this chunk
+        within = np.arange(len(chunk_ids)) - (np.cumsum(chunk_counts) - chunk_counts)[chunk_ids]
+        ordered[cursors[chunk_ids] + within] = np.asarray(values[start:start + chunk_size])[order]
+        cursors += chunk_counts
+
+    result = np.full((groups, len(quantiles)), np.nan)
+    group = 0
+    while group < groups:
+        if counts[group] > chunk_size:
+            segment = ordered[starts[group]:starts[group] + counts[group]]
+            chunks = [(chunk.min(), chunk.max()) for chunk in finite_chunks(segment, chunk_size)]
+            value_range = (min(low for low, _ in chunks), max(high for _, high in chunks))
+            result[group] = chunked_quantiles(segment, quantiles, chunk_size, value_range)
+            group += 1
+            continue
+        # The following groups whose values end within one chunk of this group's start
+        end = max(int(np.searchsorted(starts + counts, starts[group] + chunk_size, side='right')), group + 1)
+        batch = np.asarray(ordered[starts[group]:starts[end - 1] + counts[end - 1]])
+        if len(batch):
+            labels = np.repeat(np.arange(group, end), counts[group:end])
+            values = pd.Series(batch).groupby(labels).quantile(quantiles).unstack()
+            result[values.index.to_numpy()] = values.to_numpy()
+        group = end
+    return result
+
+
+def group_by_chunks(chunks, keys, aggregations, sort_by=None, ascending=False, limit=None):
+    """group_by() over an iterable of DataFrame chunks, combining partial aggregates.
+
+    Memory grows with the number of groups, not rows: counts, sums, minimums
+    and maximums are merged per chunk and nunique keeps the distinct (group,
+    value) pairs. For quantiles, (group id, value) pairs are spilled to
+    temporary files and group_quantiles() finds them exactly, a chunk at a time.
+    """
+    levels = list(range(len(keys)))
+    spec = {'count': 'sum'}
+    state = None
+    distinct = {}
+    ids = {}
+    spills = {}
+    chunk_size = 1
+    for chunk in chunks:
+        chunk_size = max(chunk_size, len(chunk))
+        grouper = [chunk[key] for key in keys]
+        grouped = chunk.groupby(grouper, observed=True, sort=False)
+        part = {'count': grouped.size()}
+        for column, names in aggregations.items():
+            names = set(names)
+            if names & {'count', 'mean'}:
+                part[f'{column}__count'], spec[f'{column}__count'] = grouped[column].count(), 'sum'
+            if names & {'sum', 'mean'}:
+                part[f'{column}__sum'], spec[f'{column}__sum'] = grouped[column].sum(), 'sum'
+            for name in names & {'min', 'max'}:
+                part[f'{column}__{name}'], spec[f'{column}__{name}'] = getattr(grouped[column], name)(), name
+
+            pairs = pd.DataFrame({**{f'k{i}': values for i, values in enumerate(grouper)}, 'value': chunk[column]}).dropna()
+            if 'nunique' in names:
+                distinct[column] = pd.concat([distinct.get(column), pairs.drop_duplicates()]).drop_duplicates()
+            if any(QUANTILE.match(name) for name in names) and len(pairs):
+                files = spills.setdefault(column, (tempfile.TemporaryFile(), tempfile.TemporaryFile()))
+                key_ids(pairs, [f'k{i}' for i in levels], ids).tofile(files[0])
+                pairs['value'].to_numpy(dtype=np.float64).tofile(files[1])
+
+        part = pd.DataFrame(part)
+        state = part if state is None else pd.concat([state, part]).groupby(level=levels, observed=True, sort=False).agg(spec)
+
+    if state is None:
+        return 0, []
+
+    result = state[['count']].copy()
+    for column, names in aggregations.items():
+        for name in names:
+            if name == 'mean':
+                result[f'{column}_mean'] = state[f'{column}__sum'] / state[f'{column}__count']
+            elif name == 'nunique':
+                counts = distinct[column].groupby([f'k{i}' for i in levels], observed=True).size()
+                result[f'{column}_nunique'] = counts.reindex(state.index, fill_value=0).to_numpy()
+            elif name in AGGREGATIONS:
+                result[f'{column}_{name}'] = state[f'{column}__{name}']
+
+    labels = state.index if isinstance(state.index, pd.MultiIndex) else [(label,) for label in state.index]
+    positions = np.array([ids.get(label, -1) for label in labels], dtype=np.int64)
+    for column, names in aggregations.items():
+        quantiles = {name: float(name[1:]) / 100 for name in names if QUANTILE.match(name)}
+        if quantiles:
+            order = sorted(set(quantiles.values()))
+            values = np.full((len(ids) + 1, len(order)), np.nan)  # the last row for groups without values
+            if column in spills:
+                arrays = []
+                for file, dtype in zip(spills[column], [np.int64, np.float64]):
+                    file.flush()
+                    arrays.append(np.memmap(file, dtype=dtype, mode='r'))
+                values[:-1] = group_quantiles(*arrays, len(ids), order, chunk_size)
+            for name, q in quantiles.items():
+                result[f'{column}_{name}'] = values[positions, order.index(q)]
+
+    return sorted_rows(result, keys, sort_by, ascending, limit)
+
+
+def sorted_rows(result, keys, sort_by, ascending, limit):
+    result.index.names = keys
+    result = result.reset_index()
+    for key in keys:
+        if isinstance(result[key].dtype, pd.CategoricalDtype):
+            # Sort keys by value rather than by category order
+            result[key] = result[key].astype(result[key].cat.categories.dtype)
+    result = result.sort_values(sort_by or 'count', ascending=ascending, kind='stable')
+    groups = len(result)
+    if limit:
+        result = result.head(limit)
+    return groups, result.to_dict(orient='records')
+
+
+def cached_group_by(csv_upload, keys, aggregations, sort_by=None, ascending=False, limit=None, filters=None):
+    """group_by() for an upload, in memory when the columns fit ANALYZER_MEMORY_BUDGET_BYTES and chunked otherwise."""
+    filters = filters or []
+    key = result_key(csv_upload, 'groupby', [keys, aggregations, sort_by, ascending, limit, filter_key(filters)])
+    result = result_cache.get(key)
+    if result is None:
+        columns = list(dict.fromkeys([*keys, *aggregations]))
+        meta = ensure_sidecar(csv_upload)
+        rows = chunk_rows(meta, columns)
+        if meta['rows'] <= rows:
+            result = group_by(load_dataframe(csv_upload, columns, filters), keys, aggregations, sort_by, ascending, limit)
+        else:
+            mask = filter_mask(csv_upload, meta, filters) if filters else None
+            result = group_by_chunks(iter_chunks(csv_upload, meta, columns, rows, mask), keys, aggregations, sort_by, ascending, limit)
+        result_cache.put(key, result)
+    return result
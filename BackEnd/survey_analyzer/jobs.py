@@ -0,0 +1,118 @@
+"""
+Background jobs for the survey analyzer.
+
+Jobs run in a per-process thread pool (ANALYZER_JOB_WORKERS threads) so the
+request that starts them can return immediately; clients poll the model the
+job updates for its status. Queued and running jobs are lost when the process
+restarts, so rows left pending or processing for longer than
+ANALYZER_JOB_TIMEOUT seconds are resubmitted when they are next looked at
+(claim_stale). CPU-bound steps of a job (see rendering.py) are
+handed to a pool of ANALYZER_PROCESS_WORKERS worker processes with
+run_in_process.
+"""
+import logging
+import multiprocessing
+import threading
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import CSVUpload
+from .columnar import MEMORY_BUDGET, convert_csv, known_hash, read_meta
+from .profiling import profile_upload, save_profiles
+
+logger = logging.getLogger(__name__)
+
+JOB_TIMEOUT = getattr(settings, 'ANALYZER_JOB_TIMEOUT', 30 * 60)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ANALYZER_JOB_WORKERS', 2),
+    thread_name_prefix='analyzer-job',
+)
+
+
+def process_pool():
+    # Started on first use; spawned rather than forked from a multithreaded server process
+    return ProcessPoolExecutor(
+        max_workers=getattr(settings, 'ANALYZER_PROCESS_WORKERS', 2),
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+_process_pool = process_pool()
+_process_pool_lock = threading.Lock()
+
+
+def submit(fn, *args, **kwargs):
+    def run():
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception(f"Analyzer job {fn.__name__} failed")
+            raise
+        finally:
+            # Database connections are per thread; don't leave this one open
+            connections.close_all()
+    return _executor.submit(run)
+
+
+def claim_stale(instance):
+    """Mark a pending or processing row whose job is presumed lost as pending again.
+
+    Returns True if this call claimed it and must submit its job again; of
+    concurrent callers, only the one whose update matches wins.
+    """
+    if instance.status not in ('pending', 'processing'):
+        return False
+    updated_at = instance.status_updated_at
+    if updated_at is not None and updated_at > timezone.now() - timedelta(seconds=JOB_TIMEOUT):
+        return False
+    now = timezone.now()
+    claimed = type(instance).objects.filter(
+        id=instance.id, status=instance.status, status_updated_at=updated_at,
+    ).update(status='pending', status_updated_at=now)
+    if claimed:
+        logger.warning(f"Resubmitting lost job for {type(instance).__name__} {instance.id}")
+        instance.status, instance.status_updated_at = 'pending', now
+    return bool(claimed)
+
+
+def run_in_process(fn, *args):
+    """Future of fn(*args) in the worker process pool; fn and its arguments must be picklable."""
+    global _process_pool
+    with _process_pool_lock:
+        try:
+            return _process_pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); later jobs get a fresh pool
+            logger.warning("Analyzer process pool was broken; starting a new one")
+            _process_pool = process_pool()
+            return _process_pool.submit(fn, *args)
+
+
+def process_upload(csv_upload_id):
+    """Stream an upload into its columnar sidecar (type inference), unless it has one, and profile its columns."""
+    CSVUpload.objects.filter(id=csv_upload_id).update(status='processing', status_updated_at=timezone.now())
+    try:
+        csv_upload = CSVUpload.objects.get(id=csv_upload_id)
+        file_path = csv_upload.file.path
+        # A duplicate of an earlier upload already has its sidecar
+        meta = read_meta(csv_upload) or convert_csv(file_path, MEMORY_BUDGET, known_hash(csv_upload))
+        save_profiles(csv_upload_id, profile_upload(csv_upload, meta), meta['rows'], meta['sha256'])
+    except CSVUpload.DoesNotExist:
+        return
+    except Exception as e:
+        logger.error(f"Error processing file {csv_upload_id}: {e}")
+        CSVUpload.objects.filter(id=csv_upload_id).update(status='failed', processing_error=str(e), status_updated_at=timezone.now())
+        return
+    CSVUpload.objects.filter(id=csv_upload_id).update(status='ready', processing_error='', status_updated_at=timezone.now())
+
+
+def resume_lost_upload(csv_upload):
+    """Resubmit the processing job of an upload left pending or processing by a restart."""
+    if claim_stale(csv_upload):
+        transaction.on_commit(lambda: submit(process_upload, csv_upload.id))
@@ -0,0 +1,34 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from survey_analyzer.encoding import encode_array
+from survey_analyzer.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Compares list/JSON and binary/orjson encoding of a scatter plot payload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        x = np.arange(options['points'], dtype=np.int64)
+        y = rng.normal(size=options['points'])
+
+        for label, renderer, binary in [
+            ('lists + JSONRenderer', JSONRenderer(), False),
+            ('lists + FastJSONRenderer', FastJSONRenderer(), False),
+            ('binary + FastJSONRenderer', FastJSONRenderer(), True),
+        ]:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                payload = {"data": [{"x": encode_array(x, binary), "y": encode_array(y, binary), "type": "scatter"}]}
+                body = renderer.render(payload)
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f'{label}: {min(timings) * 1000:.0f} ms, {len(body) / 1024 / 1024:.1f} MiB')
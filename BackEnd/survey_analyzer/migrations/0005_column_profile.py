@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey_analyzer', '0004_csvupload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='row_count',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ColumnProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('position', models.PositiveIntegerField()),
+                ('dtype', models.CharField(max_length=50)),
+                ('null_count', models.PositiveBigIntegerField()),
+                ('distinct_count', models.PositiveBigIntegerField()),
+                ('min_value', models.JSONField(blank=True, null=True)),
+                ('max_value', models.JSONField(blank=True, null=True)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('top_values', models.JSONField(default=list)),
+                ('csv_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='column_profiles', to='survey_analyzer.csvupload')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+    ]
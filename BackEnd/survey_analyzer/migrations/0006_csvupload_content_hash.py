@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey_analyzer', '0005_column_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
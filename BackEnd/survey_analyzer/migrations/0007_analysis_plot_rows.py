@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:32
+
+import json
+
+from django.db import migrations, models
+
+
+def plots_to_rows(apps, schema_editor):
+    Analysis = apps.get_model('survey_analyzer', 'Analysis')
+    Plot = apps.get_model('survey_analyzer', 'Plot')
+    for analysis in Analysis.objects.iterator():
+        Plot.objects.bulk_create(
+            Plot(
+                analysis=analysis,
+                position=position,
+                type=str(plot.get('type') or '')[:255],
+                spec={key: value for key, value in plot.items() if key != 'data'},
+                data=json.dumps(plot.get('data')),
+            )
+            for position, plot in enumerate(analysis.plots or [])
+            if isinstance(plot, dict)
+        )
+
+
+def rows_to_plots(apps, schema_editor):
+    Analysis = apps.get_model('survey_analyzer', 'Analysis')
+    Plot = apps.get_model('survey_analyzer', 'Plot')
+    for analysis in Analysis.objects.iterator():
+        analysis.plots = [
+            {**plot.spec, 'data': json.loads(plot.data)}
+            for plot in Plot.objects.filter(analysis=analysis).order_by('position')
+        ]
+        analysis.save(update_fields=['plots'])
+        Plot.objects.filter(analysis=analysis).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey_analyzer', '0006_csvupload_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='plot',
+            options={'ordering': ['position']},
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='spec',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(plots_to_rows, rows_to_plots),
+        migrations.RemoveField(
+            model_name='analysis',
+            name='plots',
+        ),
+    ]
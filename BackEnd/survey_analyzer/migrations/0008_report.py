@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:34
+
+import django.db.models.deletion
+import survey_analyzer.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey_analyzer', '0007_analysis_plot_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Report',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('file', models.FileField(blank=True, upload_to=survey_analyzer.models.report_upload_to)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reports', to='survey_analyzer.analysis')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('analysis', 'content_hash'), name='unique_report_per_analysis_content')],
+            },
+        ),
+    ]
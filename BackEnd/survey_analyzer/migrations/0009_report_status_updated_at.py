@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey_analyzer', '0008_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='status_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
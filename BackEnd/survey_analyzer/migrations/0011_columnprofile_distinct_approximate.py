@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey_analyzer', '0010_csvupload_status_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='columnprofile',
+            name='distinct_approximate',
+            field=models.BooleanField(default=False),
+        ),
+    ]
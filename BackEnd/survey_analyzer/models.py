@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+import json
 import os
 
 
@@ -8,9 +9,46 @@ def upload_to(instance, filename):
 
 
 class CSVUpload(models.Model):
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     file = models.FileField(upload_to=upload_to)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Background processing (type inference, columnar conversion) state, see jobs.py
+    status = models.CharField(max_length=20, choices=STATUSES, default='ready')
+    processing_error = models.TextField(blank=True)
+    # Set on every status change; uploads pending too long are resubmitted (jobs.claim_stale)
+    status_updated_at = models.DateTimeField(null=True, blank=True)
+    row_count = models.PositiveBigIntegerField(null=True, blank=True)
+    # SHA-256 of the file content the column profiles were computed from
+    content_hash = models.CharField(max_length=64, blank=True)
+
+
+class ColumnProfile(models.Model):
+    csv_upload = models.ForeignKey(CSVUpload, related_name='column_profiles', on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    position = models.PositiveIntegerField()
+    dtype = models.CharField(max_length=50)
+    null_count = models.PositiveBigIntegerField()
+    distinct_count = models.PositiveBigIntegerField()
+    # distinct_count is a sketch estimate for large columns with many distinct values
+    distinct_approximate = models.BooleanField(default=False)
+    # min/max/mean are only set for numeric and boolean columns
+    min_value = models.JSONField(null=True, blank=True)
+    max_value = models.JSONField(null=True, blank=True)
+    mean = models.FloatField(null=True, blank=True)
+    top_values = models.JSONField(default=list)  # [{"value": ..., "count": ...}], most frequent first
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return f"{self.name} ({self.dtype})"
 
 
 class Analysis(models.Model):
@@ -19,16 +57,50 @@ class Analysis(models.Model):
     author_name = models.CharField(max_length=255, default='Unknown Author')
     date = models.DateField(auto_now_add=True, null=True)
     description = models.TextField(blank=True, null=True)
-    plots = models.JSONField(default=list)  # Store plot configurations and data
 
     def __str__(self):
-        return this.title
+        return self.title
 
 
 class Plot(models.Model):
     analysis = models.ForeignKey('Analysis', related_name='related_plots', on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
     type = models.CharField(max_length=255)
-    data = models.TextField()  # Store plot data as JSON or plain text
+    # The plot as saved by the client (title, description, axes, ...) without its data
+    spec = models.JSONField(default=dict)
+    # The plot's data as JSON text; only read when the plot itself is requested
+    data = models.TextField()
+
+    class Meta:
+        ordering = ['position']
 
     def __str__(self):
         return f"{self.type} Plot for {self.analysis.title}"
+
+    def as_dict(self):
+        return {**self.spec, 'data': json.loads(self.data)}
+
+
+def report_upload_to(instance, filename):
+    return os.path.join('reports', str(instance.analysis.user_id), filename)
+
+
+class Report(models.Model):
+    """A published PDF of an analysis, generated in the background (see reports.py)."""
+    analysis = models.ForeignKey(Analysis, related_name='reports', on_delete=models.CASCADE)
+    # SHA-256 of the analysis content the PDF is generated from (reports.analysis_hash)
+    content_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=CSVUpload.STATUSES, default='pending')
+    error = models.TextField(blank=True)
+    file = models.FileField(upload_to=report_upload_to, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set on every status change; reports pending too long are resubmitted (jobs.claim_stale)
+    status_updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['analysis', 'content_hash'], name='unique_report_per_analysis_content'),
+        ]
+
+    def __str__(self):
+        return f"Report of {self.analysis.title} ({self.status})"
@@ -0,0 +1,175 @@
+"""
+Pivot tables for CSV uploads.
+
+Rows are grouped by the row keys on one axis and the column keys on the
+other. Each key column is dictionary-encoded (pd.factorize) and the codes of
+a row's keys are combined into one row group id and one column group id;
+counts, sums, minimums and maximums of every value column are then reduced
+per (row group, column group) cell with bincount and ufunc.at, chunk by chunk
+for uploads whose columns don't fit ANALYZER_MEMORY_BUDGET_BYTES.
+
+Aggregations are the ones that merge exactly across chunks and cells: count,
+sum, mean, min and max. Margins (totals per row, per column and overall) are
+reduced from the cells and cover all rows, including groups cut by
+top_rows/top_columns. Results are kept in the persistent result cache.
+"""
+import numpy as np
+import pandas as pd
+
+from .cache import filter_mask, load_dataframe
+from .describe import json_matrix
+from .filters import filter_key
+from .results import result_cache, result_key
+from .columnar import chunk_rows, ensure_sidecar, iter_chunks
+
+AGGREGATIONS = ['count', 'sum', 'mean', 'min', 'max']
+MAX_CELLS = 1_000_000
+
+
+class PivotTooLarge(Exception):
+    pass
+
+
+def key_ids(chunk, keys, ids):
+    """Group id of every row of chunk by its keys, adding new key tuples to ids ({tuple: id})."""
+    codes, uniques = zip(*(pd.factorize(chunk[key]) for key in keys))
+    dims = [len(values) for values in uniques]
+    local, groups = pd.factorize(np.ravel_multi_index(codes, dims))
+    positions = np.unravel_index(groups, dims)
+    labels = zip(*(values[position].tolist() for values, position in zip(uniques, positions)))
+    mapping = np.array([ids.setdefault(label, len(ids)) for label in labels], dtype=np.int64)
+    return mapping[local]
+
+
+def grow(array, shape, fill):
+    """array padded with fill at the bottom and right up to shape (new groups get the highest ids)."""
+    if array is None:
+        return np.full(shape, fill)
+    if array.shape == shape:
+        return array
+    grown = np.full(shape, fill, dtype=array.dtype)
+    grown[:array.shape[0], :array.shape[1]] = array
+    return grown
+
+
+def reduce_state(state, axis):
+    reducers = {'min': np.min, 'max': np.max}
+    return {name: reducers.get(name, np.sum)(array, axis=axis, keepdims=True) for name, array in state.items()}
+
+
+def finish(name, state):
+    """Values of aggregation name from accumulated state; NaN where undefined (no rows, or no values)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if name == 'count':
+            return state['count'].astype(float)
+        if name == 'sum':
+            return np.where(state['size'] > 0, state['sum'], np.nan)
+        if name == 'mean':
+            return np.where(state['count'] > 0, state['sum'] / state['count'], np.nan)
+        return np.where(state['count'] > 0, state[name], np.nan)
+
+
+def label_order(labels, selected):
+    try:
+        return sorted(selected, key=lambda i: labels[i])
+    except TypeError:
+        # Keys with mixed value types
+        return sorted(selected, key=lambda i: str(labels[i]))
+
+
+def top_groups(labels, totals, limit):
+    """Ids of the limit groups with the most rows (all without a limit), ordered by key."""
+    selected = np.argsort(-totals, kind='stable')[:limit] if limit else range(len(labels))
+    return label_order(labels, [int(i) for i in selected])
+
+
+def pivot(chunks, rows, columns, values, margins=False, top_rows=None, top_columns=None):
+    """Pivot table of DataFrame chunks: {value name: matrix} over row and column key tuples.
+
+    values maps value columns to aggregations and results are named
+    '<column>_<aggregation>'; without values the matrix is the number of rows
+    per cell, named 'count'. Rows with a missing key are left out. With
+    margins, a last row and column (keys null) hold the totals.
+    """
+    row_ids, column_ids = {}, {}
+    sizes = None
+    states = {column: {} for column in values}
+    for chunk in chunks:
+        chunk = chunk[chunk[[*rows, *columns]].notna().all(axis=1).to_numpy()]
+        if not len(chunk):
+            continue
+        r = key_ids(chunk, rows, row_ids)
+        c = key_ids(chunk, columns, column_ids)
+        shape = (len(row_ids), len(column_ids))
+        if shape[0] * shape[1] > MAX_CELLS:
+            raise PivotTooLarge(f"The pivot has more than {MAX_CELLS} cells; filter the rows or use keys with fewer values.")
+        cells = r * shape[1] + c
+
+        sizes = grow(sizes, shape, 0) + np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+        for column, names in values.items():
+            state = states[column]
+            present = chunk[column].notna().to_numpy()
+            state['count'] = grow(state.get('count'), shape, 0) + np.bincount(cells[present], minlength=shape[0] * shape[1]).reshape(shape)
+            if set(names) - {'count'}:
+                numbers = chunk[column].to_numpy(dtype=float)[present]
+                state['sum'] = grow(state.get('sum'), shape, 0.0) + np.bincount(cells[present], weights=numbers, minlength=shape[0] * shape[1]).reshape(shape)
+                state['min'] = grow(state.get('min'), shape, np.inf)
+                state['max'] = grow(state.get('max'), shape, -np.inf)
+                np.minimum.at(state['min'], (r[present], c[present]), numbers)
+                np.maximum.at(state['max'], (r[present], c[present]), numbers)
+
+    row_labels, column_labels = list(row_ids), list(column_ids)
+    result = {
+        'row_keys': rows, 'column_keys': columns,
+        'row_groups': len(row_labels), 'column_groups': len(column_labels),
+    }
+    if sizes is None:
+        names = [f'{column}_{name}' for column, names in values.items() for name in names] or ['count']
+        return {**result, 'index': [], 'columns': [], 'data': {name: [] for name in names}}
+
+    row_order = top_groups(row_labels, sizes.sum(axis=1), top_rows)
+    column_order = top_groups(column_labels, sizes.sum(axis=0), top_columns)
+    index = [list(row_labels[i]) for i in row_order]
+    header = [list(column_labels[i]) for i in column_order]
+    if margins:
+        index.append([None] * len(rows))
+        header.append([None] * len(columns))
+
+    def matrix(name, state):
+        cells = finish(name, state)[np.ix_(row_order, column_order)]
+        if margins:
+            by_row = finish(name, reduce_state(state, 1))[row_order]
+            by_column = finish(name, reduce_state(state, 0))[:, column_order]
+            total = finish(name, reduce_state(state, None))
+            cells = np.block([[cells, by_row], [by_column, total]])
+        if name == 'count':
+            return cells.astype(np.int64).tolist()
+        return json_matrix(cells)
+
+    if values:
+        data = {
+            f'{column}_{name}': matrix(name, {**states[column], 'size': sizes})
+            for column, names in values.items() for name in names
+        }
+    else:
+        data = {'count': matrix('count', {'count': sizes})}
+    return {**result, 'index': index, 'columns': header, 'data': data}
+
+
+def cached_pivot(csv_upload, rows, columns, values, margins=False, top_rows=None, top_columns=None, filters=None):
+    """pivot() for an upload, in one pass when the columns fit ANALYZER_MEMORY_BUDGET_BYTES and chunked otherwise."""
+    filters = filters or []
+    key = result_key(csv_upload, 'pivot', [rows, columns, values, margins, top_rows, top_columns, filter_key(filters)])
+    result = result_cache.get(key)
+    if result is None:
+        names = list(dict.fromkeys([*rows, *columns, *values]))
+        meta = ensure_sidecar(csv_upload)
+        size = chunk_rows(meta, names)
+        if meta['rows'] <= size:
+            chunks = [load_dataframe(csv_upload, names, filters)]
+        else:
+            mask = filter_mask(csv_upload, meta, filters) if filters else None
+            chunks = iter_chunks(csv_upload, meta, names, size, mask)
+        result = pivot(chunks, rows, columns, values, margins, top_rows, top_columns)
+        result_cache.put(key, result)
+    return result
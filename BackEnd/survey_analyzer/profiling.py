@@ -0,0 +1,184 @@
+"""
+Column profiles for CSV uploads.
+
+Profiles are computed once per upload (in the processing job, or on first use
+for older uploads) from the columnar sidecar one column and one chunk at a
+time, and stored as ColumnProfile rows so requests can validate columns
+without rescanning them.
+
+Numeric columns read in chunks keep bounded state: distinct values are
+counted with a KMV sketch (the DISTINCT_SKETCH_SIZE smallest value hashes),
+exact up to that many distinct values and an estimate (distinct_approximate)
+beyond; top values are candidates kept by a Misra-Gries summary of
+TOP_CANDIDATES counters, counted exactly in a second pass when the summary
+had to drop values.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from .models import CSVUpload, ColumnProfile
+from .cache import check_ready
+from .columnar import chunk_rows, ensure_sidecar, iter_chunks, load_column
+
+TOP_VALUES = 10
+DISTINCT_SKETCH_SIZE = 4096
+TOP_CANDIDATES = 1000
+
+
+def json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def profile_dataframe(df):
+    """Profile dicts (ColumnProfile fields) for every column of df."""
+    null_counts = df.isna().sum()
+    distinct_counts = df.nunique(dropna=True)
+    numeric = df.select_dtypes(include=['number', 'bool'])
+    # Per column, so integer columns aren't upcast to a common float dtype
+    minimums = {name: numeric[name].min() for name in numeric.columns}
+    maximums = {name: numeric[name].max() for name in numeric.columns}
+    means = numeric.astype(float).mean()
+
+    profiles = []
+    for position, name in enumerate(df.columns):
+        is_numeric = is_numeric_dtype(df[name].dtype) or is_bool_dtype(df[name].dtype)
+        top = df[name].value_counts(dropna=True).head(TOP_VALUES)
+        profiles.append({
+            'name': str(name),
+            'position': position,
+            'dtype': str(df[name].dtype),
+            'null_count': int(null_counts[name]),
+            'distinct_count': int(distinct_counts[name]),
+            'distinct_approximate': False,
+            'min_value': json_value(minimums[name]) if is_numeric else None,
+            'max_value': json_value(maximums[name]) if is_numeric else None,
+            'mean': json_value(means[name]) if is_numeric else None,
+            'top_values': [{'value': json_value(value), 'count': int(count)} for value, count in top.items()],
+        })
+    return profiles
+
+
+def profile_column(csv_upload, meta, position, entry, rows):
+    """Profile dict for one sidecar column, accumulated chunk by chunk."""
+    name = entry['name']
+    if entry['kind'] == 'csv':
+        profile = profile_dataframe(load_column(csv_upload, meta, name).to_frame())[0]
+        return {**profile, 'position': position}
+
+    null_count = 0
+    if entry['kind'] == 'categorical':
+        counts = None
+        for chunk in iter_chunks(csv_upload, meta, [name], rows):
+            values = chunk[name].array
+            codes = values.codes
+            null_count += int((codes < 0).sum())
+            chunk_counts = np.bincount(codes[codes >= 0], minlength=len(values.categories))
+            counts = chunk_counts if counts is None else counts + chunk_counts
+        categories = values.categories if meta['rows'] else []
+        counts = counts if counts is not None else np.zeros(0, dtype=np.int64)
+        order = [i for i in np.argsort(-counts, kind='stable')[:TOP_VALUES] if counts[i]]
+        return {
+            'name': name,
+            'position': position,
+            'dtype': entry['dtype'],
+            'null_count': null_count,
+            'distinct_count': int((counts > 0).sum()),
+            'distinct_approximate': False,
+            'min_value': None,
+            'max_value': None,
+            'mean': None,
+            'top_values': [{'value': categories[i], 'count': int(counts[i])} for i in order],
+        }
+
+    minimum = maximum = None
+    total = 0.0
+    count = 0
+    hashes = np.empty(0, dtype=np.uint64)
+    candidates = pd.Series(dtype=float)
+    summarized = False
+    for chunk in iter_chunks(csv_upload, meta, [name], rows):
+        values = chunk[name]
+        present = values[values.notna()]
+        null_count += len(values) - len(present)
+        if len(present):
+            minimum = present.min() if minimum is None else min(minimum, present.min())
+            maximum = present.max() if maximum is None else max(maximum, present.max())
+            total += present.astype(float).sum()
+            count += len(present)
+
+        chunk_hashes = pd.util.hash_array(present.to_numpy())
+        if len(hashes) == DISTINCT_SKETCH_SIZE:
+            chunk_hashes = chunk_hashes[chunk_hashes < hashes[-1]]
+        hashes = np.union1d(hashes, chunk_hashes)[:DISTINCT_SKETCH_SIZE]
+
+        candidates = candidates.add(present.value_counts(), fill_value=0)
+        if len(candidates) > TOP_CANDIDATES:
+            # Misra-Gries: values more frequent than 1 / TOP_CANDIDATES of the rows always stay.
+            # Values tied at the floor are kept at 0 so columns of unique values still have candidates.
+            largest = candidates.nlargest(TOP_CANDIDATES + 1, keep='first')
+            candidates = largest.iloc[:TOP_CANDIDATES] - largest.iloc[-1]
+            summarized = True
+
+    if summarized:
+        candidates = pd.Series(0.0, index=candidates.index)
+        for chunk in iter_chunks(csv_upload, meta, [name], rows):
+            values = chunk[name]
+            candidates = candidates.add(values[values.isin(candidates.index)].value_counts(), fill_value=0)
+    top = candidates.sort_values(ascending=False, kind='stable').head(TOP_VALUES)
+
+    distinct_approximate = len(hashes) == DISTINCT_SKETCH_SIZE
+    if distinct_approximate:
+        # The k-th smallest of n uniform hashes is about k / n of the hash range
+        distinct_count = min(round((DISTINCT_SKETCH_SIZE - 1) * 2.0 ** 64 / (float(hashes[-1]) + 1)), count)
+    else:
+        distinct_count = len(hashes)
+    return {
+        'name': name,
+        'position': position,
+        'dtype': entry['dtype'],
+        'null_count': int(null_count),
+        'distinct_count': int(distinct_count),
+        'distinct_approximate': distinct_approximate,
+        'min_value': json_value(minimum),
+        'max_value': json_value(maximum),
+        'mean': json_value(total / count) if count else None,
+        'top_values': [{'value': json_value(value), 'count': int(n)} for value, n in top.items()],
+    }
+
+
+def profile_upload(csv_upload, meta=None):
+    """Profile dicts for every column of an upload, read from its sidecar in memory-bounded chunks."""
+    meta = meta or ensure_sidecar(csv_upload)
+    return [
+        profile_column(csv_upload, meta, position, entry, chunk_rows(meta, [entry['name']]))
+        for position, entry in enumerate(meta['columns'])
+    ]
+
+
+def save_profiles(csv_upload_id, profiles, row_count, content_hash):
+    with transaction.atomic():
+        ColumnProfile.objects.filter(csv_upload_id=csv_upload_id).delete()
+        ColumnProfile.objects.bulk_create(
+            ColumnProfile(csv_upload_id=csv_upload_id, **profile) for profile in profiles
+        )
+        CSVUpload.objects.filter(id=csv_upload_id).update(row_count=row_count, content_hash=content_hash)
+
+
+def column_profiles(csv_upload):
+    """{column name: ColumnProfile} for an upload, profiling it first if that never happened or the file changed."""
+    profiles = {profile.name: profile for profile in csv_upload.column_profiles.all()}
+    check_ready(csv_upload)
+    meta = ensure_sidecar(csv_upload)
+    if not profiles or csv_upload.row_count is None or csv_upload.content_hash != meta['sha256']:
+        save_profiles(csv_upload.id, profile_upload(csv_upload, meta), meta['rows'], meta['sha256'])
+        csv_upload.refresh_from_db(fields=['row_count', 'content_hash'])
+        profiles = {profile.name: profile for profile in ColumnProfile.objects.filter(csv_upload=csv_upload)}
+    return profiles
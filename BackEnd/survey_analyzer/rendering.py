@@ -0,0 +1,161 @@
+"""
+Rendering steps of report jobs that run in the worker process pool (jobs.run_in_process).
+
+Worker processes are spawned without Django set up, so nothing here may use
+Django: functions take and return plain, picklable values.
+
+render_plot draws a saved Plotly figure ({"data": [...], "layout": {...}},
+as returned by plot-data/) on a matplotlib Agg canvas, with no display or
+browser. It covers the traces plot-data/ produces: bar (including
+histograms), scatter, line, area, box (raw values or precomputed
+statistics), pie and heatmap.
+"""
+import io
+
+import numpy as np
+import pdfkit
+
+from .encoding import decode_array
+
+FIGURE_SIZE = (8, 4.5)  # inches
+FIGURE_DPI = 100
+
+
+def render_pdf(html):
+    """PDF bytes of an HTML document, rendered by wkhtmltopdf."""
+    return pdfkit.from_string(html, False)
+
+
+def title_text(title):
+    return title.get('text') if isinstance(title, dict) else title
+
+
+def label_text(value):
+    return f'{value:.4g}' if isinstance(value, float) else str(value)
+
+
+def numeric(values):
+    """values as floats (missing values as NaN), or None when they are not numbers."""
+    try:
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    except (TypeError, ValueError):
+        return None
+
+
+def box_stats(trace, name):
+    """matplotlib bxp() statistics for a box trace, from its precomputed statistics or raw values."""
+    if 'q1' in trace:
+        return {
+            'label': name,
+            'q1': trace['q1'][0], 'med': trace['median'][0], 'q3': trace['q3'][0],
+            'whislo': trace['lowerfence'][0], 'whishi': trace['upperfence'][0],
+            'mean': trace.get('mean', [None])[0], 'fliers': [],
+        }
+    values = numeric(decode_array(trace.get('y')))
+    values = values[~np.isnan(values)] if values is not None else np.empty(0)
+    if not len(values):
+        return None
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {
+        'label': name, 'q1': q1, 'med': median, 'q3': q3,
+        'whislo': inside.min(), 'whishi': inside.max(), 'mean': values.mean(),
+        'fliers': values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)],
+    }
+
+
+def draw_heatmap(figure, ax, trace):
+    z = np.asarray(decode_array(trace.get('z')), dtype=object)
+    z = numeric(z.ravel()).reshape(z.shape)
+    x = list(decode_array(trace.get('x')))
+    y = list(decode_array(trace.get('y')))
+    if z.ndim == 2 and z.shape == (len(x), len(y)) and z.shape != (len(y), len(x)):
+        z = z.T
+    image = ax.imshow(
+        np.ma.masked_invalid(z), aspect='auto', origin='lower', interpolation='nearest',
+        vmin=trace.get('zmin'), vmax=trace.get('zmax'),
+    )
+    for axis, labels, count in [(ax.xaxis, x, z.shape[1]), (ax.yaxis, y, z.shape[0])]:
+        if len(labels) == count and count <= 50:
+            axis.set_ticks(range(count))
+            axis.set_ticklabels([label_text(label) for label in labels])
+    if z.shape[1] > 10:
+        ax.tick_params(axis='x', labelrotation=90)
+    figure.colorbar(image, ax=ax)
+
+
+def render_plot(figure_data):
+    """PNG bytes of a Plotly figure dict."""
+    # Imported here so the web process never loads matplotlib; a bare Figure draws with Agg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    ax = figure.subplots()
+    layout = figure_data.get('layout') or {}
+    traces = figure_data.get('data') or []
+    overlay = layout.get('barmode') == 'overlay'
+    boxes = []  # bxp() statistics of box traces, drawn at x = 1, 2, ...
+
+    for trace in traces:
+        kind = trace.get('type', 'scatter')
+        name = trace.get('name')
+        if kind == 'box':
+            label = trace['x'][0] if 'q1' in trace and trace.get('x') else name
+            stats = box_stats(trace, label)
+            if stats is not None:
+                boxes.append(stats)
+            continue
+        if kind == 'pie':
+            values = numeric(decode_array(trace.get('values')))
+            ax.pie(np.nan_to_num(values), labels=[label_text(label) for label in trace.get('labels') or []], autopct='%1.1f%%')
+            ax.axis('equal')
+            continue
+        if kind == 'heatmap':
+            draw_heatmap(figure, ax, trace)
+            continue
+
+        x = decode_array(trace.get('x'))
+        y = decode_array(trace.get('y'))
+        if kind == 'histogram':
+            values = numeric(x if len(x) else y)
+            ax.hist(values[~np.isnan(values)], bins='auto', alpha=0.6 if len(traces) > 1 else 1, label=name)
+            continue
+
+        x_numbers = numeric(x)
+        box_labels = [stats['label'] for stats in boxes]
+        if boxes and all(value in box_labels for value in x):
+            # Outliers drawn next to precomputed box statistics
+            x_numbers = np.array([box_labels.index(value) + 1 for value in x], dtype=float)
+        if x_numbers is None:
+            x_numbers = np.arange(len(x), dtype=float)
+            ax.set_xticks(x_numbers[::max(len(x) // 20, 1)])
+            ax.set_xticklabels([label_text(value) for value in x[::max(len(x) // 20, 1)]], rotation=45, ha='right')
+        y_numbers = numeric(y)
+
+        if kind == 'bar':
+            width = trace.get('width')
+            width = decode_array(width) if width is not None else 0.8
+            ax.bar(x_numbers, y_numbers, width=width, alpha=0.6 if overlay and len(traces) > 1 else 1, label=name)
+        elif trace.get('fill') in ('tozeroy', 'tonexty'):
+            ax.plot(x_numbers, y_numbers, label=name)
+            ax.fill_between(x_numbers, y_numbers, alpha=0.3)
+        elif trace.get('mode') == 'markers':
+            ax.scatter(x_numbers, y_numbers, s=8, label=name if trace.get('showlegend', True) else None)
+        else:
+            marker = 'o' if 'markers' in (trace.get('mode') or '') and len(x_numbers) <= 1000 else None
+            ax.plot(x_numbers, y_numbers, marker=marker, markersize=3, label=name)
+
+    if boxes:
+        ax.bxp(boxes, positions=range(1, len(boxes) + 1), showmeans=all(stats['mean'] is not None for stats in boxes))
+
+    ax.set_title(title_text(layout.get('title')) or '')
+    ax.set_xlabel(title_text((layout.get('xaxis') or {}).get('title')) or '')
+    ax.set_ylabel(title_text((layout.get('yaxis') or {}).get('title')) or '')
+    if len(ax.get_legend_handles_labels()[1]) > 1 and not any(trace.get('type') == 'pie' for trace in traces):
+        ax.legend()
+    figure.tight_layout()
+
+    output = io.BytesIO()
+    figure.savefig(output, format='png')
+    return output.getvalue()
@@ -0,0 +1,159 @@
+"""
+Published PDF reports of analyses.
+
+Publishing an analysis returns the Report for the current content of the
+analysis, keyed by a SHA-256 of that content (analysis_hash). An unchanged
+analysis is served the PDF generated before; otherwise a background job
+builds the HTML and renders it to PDF in the worker process pool, and
+clients poll the report's status until it is ready to download. A report
+whose job was lost (see jobs.claim_stale) is resubmitted when it is
+published or polled again.
+
+Every plot with figure data is drawn as a PNG embedded in the report. The
+plots of a report are rendered in parallel in the worker process pool, and
+each image is kept in the result cache under a hash of the plot's spec and
+data, so only new or changed plots are drawn again.
+"""
+import base64
+import hashlib
+import json
+import logging
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import Analysis, Report
+from .jobs import claim_stale, run_in_process, submit
+from .rendering import render_pdf, render_plot
+from .results import result_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump when the report layout changes, so existing PDFs are regenerated
+REPORT_VERSION = 2
+# Bump when plot rendering changes, so cached plot images are drawn again
+PLOT_IMAGE_VERSION = 1
+
+
+def analysis_hash(analysis):
+    """SHA-256 of everything a report of analysis is generated from."""
+    content = [
+        REPORT_VERSION, analysis.title, analysis.author_name, str(analysis.date), analysis.description,
+        [[plot.spec, plot.data] for plot in analysis.related_plots.all()],
+    ]
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def plot_image_key(plot):
+    content = json.dumps([PLOT_IMAGE_VERSION, plot.spec], sort_keys=True, default=str)
+    return hashlib.sha256(f'plot-image:{content}:{plot.data}'.encode()).hexdigest()
+
+
+def plot_images(plots):
+    """{plot id: base64 PNG} for the plots that have figure data, drawn in parallel in the process pool."""
+    images, pending = {}, {}
+    for plot in plots:
+        key = plot_image_key(plot)
+        cached = result_cache.get(key)
+        if cached is not None:
+            images[plot.id] = cached
+            continue
+        figure = json.loads(plot.data)
+        if isinstance(figure, dict) and isinstance(figure.get('data'), list):
+            pending[plot.id] = (key, run_in_process(render_plot, figure))
+
+    for plot_id, (key, future) in pending.items():
+        try:
+            images[plot_id] = base64.b64encode(future.result()).decode('ascii')
+        except Exception as e:
+            # The report is still published, with this plot's title and description only
+            logger.error(f"Error rendering plot {plot_id}: {e}")
+            continue
+        result_cache.put(key, images[plot_id])
+    return images
+
+
+def plot_html(plot, image):
+    img = f'<img src="data:image/png;base64,{image}" style="width: 100%">' if image else ''
+    return f"<div><h3>{escape(plot.spec.get('title') or 'Untitled')}</h3>{img}<p>{escape(plot.spec.get('description') or '')}</p></div>"
+
+
+def report_html(analysis, images=None):
+    images = images or {}
+    plots = ''.join(plot_html(plot, images.get(plot.id)) for plot in analysis.related_plots.all())
+    return f"""
+    <html>
+    <head><meta charset="utf-8"><title>{escape(analysis.title)}</title></head>
+    <body>
+        <h1>{escape(analysis.title)}</h1>
+        <p><strong>Author:</strong> {escape(analysis.author_name)}</p>
+        <p><strong>Date:</strong> {analysis.date}</p>
+        <p>{escape(analysis.description or '')}</p>
+        <h2>Plots</h2>
+        {plots}
+    </body>
+    </html>
+    """
+
+
+def publish(analysis):
+    """The Report of the current content of analysis, with a generation job started if it has no PDF yet."""
+    content_hash = analysis_hash(analysis)
+    with transaction.atomic():
+        # Concurrent publishes of one analysis wait here, so a job is only started once
+        list(Analysis.objects.select_for_update().filter(id=analysis.id).values_list('id', flat=True))
+        report, created = Report.objects.get_or_create(
+            analysis=analysis, content_hash=content_hash, defaults={'status_updated_at': timezone.now()},
+        )
+        missing = report.status == 'ready' and not (report.file and report.file.storage.exists(report.file.name))
+        if created or report.status == 'failed' or missing:
+            now = timezone.now()
+            Report.objects.filter(id=report.id).update(status='pending', error='', status_updated_at=now)
+            report.status, report.error, report.status_updated_at = 'pending', '', now
+            transaction.on_commit(lambda: submit(generate_report, report.id))
+        else:
+            resume_lost(report)
+    return report
+
+
+def resume_lost(report):
+    """Resubmit the job of a report left pending or processing by a restart."""
+    if claim_stale(report):
+        transaction.on_commit(lambda: submit(generate_report, report.id))
+
+
+def generate_report(report_id):
+    """Render a Report's PDF and keep it as the only report of its analysis."""
+    Report.objects.filter(id=report_id).update(status='processing', status_updated_at=timezone.now())
+    try:
+        report = Report.objects.select_related('analysis').get(id=report_id)
+        analysis = Analysis.objects.prefetch_related('related_plots').get(id=report.analysis_id)
+        images = plot_images(analysis.related_plots.all())
+        pdf = run_in_process(render_pdf, report_html(analysis, images)).result()
+        report.file.save(f"{report.content_hash}.pdf", ContentFile(pdf), save=False)
+        saved = Report.objects.filter(id=report_id).update(
+            status='ready', error='', file=report.file.name, status_updated_at=timezone.now(),
+        )
+        if not saved:
+            # Deleted while rendering (e.g. superseded, or its analysis deleted)
+            report.file.delete(save=False)
+            return
+    except (Report.DoesNotExist, Analysis.DoesNotExist):
+        return
+    except Exception as e:
+        logger.error(f"Error generating report {report_id}: {e}")
+        Report.objects.filter(id=report_id).update(status='failed', error=str(e), status_updated_at=timezone.now())
+        return
+
+    # Earlier reports of other versions of the analysis are not served again. Newer
+    # reports, and the report of the analysis' current content, are left alone even
+    # when this job finishes after theirs.
+    stale_reports = (
+        Report.objects.filter(analysis_id=report.analysis_id, id__lt=report_id)
+        .exclude(content_hash=analysis_hash(analysis))
+    )
+    for stale in stale_reports:
+        stale.file.delete(save=False)
+        stale.delete()
@@ -0,0 +1,162 @@
+"""
+Persistent, content-addressed cache of analyzer results.
+
+Plot and group-by results are stored in a SQLite file
+(ANALYZER_RESULT_CACHE_PATH) keyed by a hash of the normalized request and
+the SHA-256 of the uploaded file's content. A changed file has a different
+hash, so its old results are simply never looked up again; identical files
+share results. Least recently used results are evicted once the stored
+results exceed ANALYZER_RESULT_CACHE_BYTES (see ResultCache).
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import orjson
+from django.conf import settings
+
+from .cache import check_ready
+from .columnar import ensure_sidecar
+
+# Bump when the shape of cached results changes
+RESULT_VERSION = 1
+
+
+class ResultCache:
+    """SQLite-backed result store, shared by every process using the same file.
+
+    Each thread keeps its own connection. Reads take no lock and only write
+    when a result's access time is more than ACCESS_RESOLUTION seconds old,
+    so hot results are not rewritten on every hit. The total size of the
+    stored results is kept in the totals table, updated with every insert
+    and eviction. Once it exceeds max_bytes, the least recently used results
+    are deleted in one statement, down to EVICT_TO of max_bytes.
+    """
+    ACCESS_RESOLUTION = 60
+    EVICT_TO = 0.9
+
+    def __init__(self, path, max_bytes):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def connection(self):
+        """This thread's connection (autocommit; writes open their own transaction)."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            with self._lock:
+                if not self._ready:
+                    self.create_schema(connection)
+                    self._ready = True
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def create_schema(connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        with write_transaction(connection):
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+            connection.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)')
+            # Files written before the totals table existed start from their current size
+            connection.execute('INSERT OR IGNORE INTO totals (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM results')
+
+    def count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key):
+        connection = self.connection()
+        row = connection.execute('SELECT value, accessed FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.count('misses')
+            return None
+        self.count('hits')
+        now = time.time()
+        if now - row[1] > self.ACCESS_RESOLUTION:
+            try:
+                connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+            except sqlite3.OperationalError:
+                pass  # Busy: recency is approximate anyway
+        return orjson.loads(row[0])
+
+    def put(self, key, value):
+        blob = orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        if len(blob) > self.max_bytes:
+            return
+        connection = self.connection()
+        with write_transaction(connection):
+            replaced = connection.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+            connection.execute(
+                'INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                (key, blob, len(blob), time.time()),
+            )
+            connection.execute('UPDATE totals SET bytes = bytes + ? WHERE id = 0', (len(blob) - (replaced[0] if replaced else 0),))
+            total = connection.execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+            if total > self.max_bytes:
+                self.evict(connection, total - int(self.max_bytes * self.EVICT_TO))
+
+    def evict(self, connection, excess):
+        """Delete the least recently used results whose sizes add up to at least excess bytes."""
+        oldest = (
+            'SELECT key, size FROM ('
+            'SELECT key, size, SUM(size) OVER (ORDER BY accessed ROWS UNBOUNDED PRECEDING) AS running FROM results'
+            ') WHERE running - size < ?'
+        )
+        count, freed = connection.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ({oldest})', (excess,)).fetchone()
+        connection.execute(f'DELETE FROM results WHERE key IN (SELECT key FROM ({oldest}))', (excess,))
+        connection.execute('UPDATE totals SET bytes = bytes - ? WHERE id = 0', (freed,))
+        self.count('evictions', count)
+
+    def stats(self):
+        connection = self.connection()
+        entries = connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        size = connection.execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+        }
+
+
+@contextmanager
+def write_transaction(connection):
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit connection, rolled back on errors."""
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+result_cache = ResultCache(
+    getattr(settings, 'ANALYZER_RESULT_CACHE_PATH', settings.BASE_DIR / 'analyzer_results.sqlite3'),
+    getattr(settings, 'ANALYZER_RESULT_CACHE_BYTES', 256 * 1024 * 1024),
+)
+
+
+def result_key(csv_upload, kind, spec):
+    """Cache key for a normalized request spec on the current content of an upload."""
+    check_ready(csv_upload)
+    normalized = json.dumps([RESULT_VERSION, kind, spec], sort_keys=True, default=str)
+    content = ensure_sidecar(csv_upload)['sha256']
+    return hashlib.sha256(f'{content}:{normalized}'.encode()).hexdigest()
@@ -1,23 +1,225 @@
+import json
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import CSVUpload, Analysis
+from django.urls import reverse
+from .models import CSVUpload, Analysis, ColumnProfile, Plot, Report
+from .groupby import is_aggregation
+from .describe import METHODS
+from .pivot import AGGREGATIONS as PIVOT_AGGREGATIONS
+from .filters import OPS
+
+
+class ColumnProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ColumnProfile
+        fields = ['name', 'position', 'dtype', 'null_count', 'distinct_count', 'distinct_approximate', 'min_value', 'max_value', 'mean', 'top_values']
 
 
 class CSVUploadSerializer(serializers.ModelSerializer):
+    column_profiles = ColumnProfileSerializer(many=True, read_only=True)
+
     class Meta:
         model = CSVUpload
-        fields = ['id', 'user', 'file', 'uploaded_at']
-        read_only_fields = ['id', 'user', 'uploaded_at']
+        fields = ['id', 'user', 'file', 'uploaded_at', 'status', 'processing_error', 'row_count', 'column_profiles']
+        read_only_fields = ['id', 'user', 'uploaded_at', 'status', 'processing_error', 'row_count']
 
 
 class AnalysisSerializer(serializers.ModelSerializer):
+    plots = serializers.ListField(child=serializers.DictField(), required=False)
+
     class Meta:
         model = Analysis
         fields = ['id', 'user', 'title', 'author_name', 'date', 'description', 'plots']
         read_only_fields = ['id', 'user', 'date']
 
+    def to_representation(self, instance):
+        plots = [plot.as_dict() for plot in instance.related_plots.all()]
+        return {**super().to_representation(instance), 'plots': plots}
+
+    def save_plots(self, analysis, plots):
+        Plot.objects.filter(analysis=analysis).delete()
+        Plot.objects.bulk_create(
+            Plot(
+                analysis=analysis,
+                position=position,
+                type=str(plot.get('type') or '')[:255],
+                spec={key: value for key, value in plot.items() if key != 'data'},
+                data=json.dumps(plot.get('data')),
+            )
+            for position, plot in enumerate(plots)
+        )
+
+    def create(self, validated_data):
+        plots = validated_data.pop('plots', [])
+        with transaction.atomic():
+            analysis = super().create(validated_data)
+            self.save_plots(analysis, plots)
+        return analysis
+
+    def update(self, instance, validated_data):
+        plots = validated_data.pop('plots', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if plots is not None:
+                self.save_plots(instance, plots)
+        return instance
+
+
+class AnalysisSummarySerializer(serializers.ModelSerializer):
+    """An analysis with only the titles and types of its plots, for listing many analyses."""
+    plots = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Analysis
+        fields = ['id', 'user', 'title', 'author_name', 'date', 'description', 'plots']
+
+    def get_plots(self, obj):
+        return [
+            {'position': plot.position, 'type': plot.type, 'title': plot.spec.get('title')}
+            for plot in obj.related_plots.all()
+        ]
+
+
+class ReportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Report
+        fields = ['id', 'analysis', 'content_hash', 'status', 'error', 'created_at', 'download_url']
+
+    def get_download_url(self, obj):
+        if obj.status != 'ready':
+            return None
+        url = reverse('report-download', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class FilterSerializer(serializers.Serializer):
+    column = serializers.CharField()
+    op = serializers.ChoiceField(choices=OPS)
+    value = serializers.JSONField(required=False)
+
+    def validate(self, data):
+        if data['op'] in ('in', 'not_in') and not isinstance(data.get('value'), list):
+            raise serializers.ValidationError({"value": "A list of values is required for in and not_in."})
+        if data['op'] not in ('is_null', 'not_null', 'in', 'not_in') and (data.get('value') is None or isinstance(data['value'], (list, dict))):
+            raise serializers.ValidationError({"value": "A single value is required for comparisons."})
+        return data
+
 
 class PlotDataSerializer(serializers.Serializer):
     plot_type = serializers.ChoiceField(choices=['scatter', 'bar', 'line', 'pie', 'histogram', 'heatmap', 'box', 'area'])
     x_axis = serializers.CharField(required=False, allow_blank=True)
     y_axes = serializers.ListField(child=serializers.CharField(), required=False)
-    csv_upload_id = serializers.IntegerField()
\ No newline at end of file
+    csv_upload_id = serializers.IntegerField()
+    # Only rows matching all of these conditions are plotted
+    filters = FilterSerializer(many=True, required=False)
+    # Scatter, line and area plots only: cap the points per series
+    max_points = serializers.IntegerField(required=False, min_value=3)
+    downsample = serializers.ChoiceField(choices=['lttb', 'minmax'], required=False)
+    # 'binary' sends numeric arrays as base64 typed arrays ({"dtype", "bdata"}) instead of lists
+    encoding = serializers.ChoiceField(choices=['json', 'binary'], required=False)
+    # Histograms only: a bin count, 'fd' (Freedman-Diaconis) or 'auto'; or a fixed bin_width
+    bins = serializers.CharField(required=False)
+    bin_width = serializers.FloatField(required=False)
+    # Histograms and box statistics: process columns in chunks of this many rows
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
+    # Box plots only: send quartiles, whiskers and a sample of outliers instead of every value
+    box_stats = serializers.BooleanField(required=False)
+    max_outliers = serializers.IntegerField(required=False, min_value=0, max_value=10_000)
+    # Heatmaps only: 'values' plots the raw rows, 'grid' aggregates x_axis against
+    # y_axes[0] into a grid, 'correlation' plots the correlation matrix of y_axes
+    heatmap_mode = serializers.ChoiceField(choices=['values', 'grid', 'correlation'], required=False)
+    aggregate = serializers.ChoiceField(choices=['count', 'mean', 'sum'], required=False)
+    value_column = serializers.CharField(required=False)
+    grid_size = serializers.IntegerField(required=False, min_value=1, max_value=500)
+
+    def validate_bins(self, value):
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+        if value in ['fd', 'auto']:
+            return value
+        raise serializers.ValidationError("bins must be a positive integer, 'fd' or 'auto'.")
+
+    def validate_bin_width(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("bin_width must be positive.")
+        return value
+
+    def validate(self, data):
+        if data.get('aggregate') in ['mean', 'sum'] and not data.get('value_column'):
+            raise serializers.ValidationError({"value_column": "value_column is required for mean and sum."})
+        return data
+
+
+class BatchPlotDataSerializer(serializers.Serializer):
+    csv_upload_id = serializers.IntegerField()
+    # PlotDataSerializer fields for each plot, without csv_upload_id
+    plots = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=50)
+    parallel = serializers.BooleanField(required=False, default=True)
+
+
+class GroupBySerializer(serializers.Serializer):
+    csv_upload_id = serializers.IntegerField()
+    # Legacy form: row counts per value of each column, grouped separately
+    columns = serializers.ListField(child=serializers.CharField(), required=False)
+    # Group by all keys at once, with {value column: [aggregations]}
+    keys = serializers.ListField(child=serializers.CharField(), required=False)
+    aggregations = serializers.DictField(child=serializers.ListField(child=serializers.CharField()), required=False)
+    sort_by = serializers.CharField(required=False)
+    ascending = serializers.BooleanField(required=False, default=False)
+    limit = serializers.IntegerField(required=False, min_value=1)
+    filters = FilterSerializer(many=True, required=False)
+
+    def validate_aggregations(self, value):
+        invalid = [name for names in value.values() for name in names if not is_aggregation(name)]
+        if invalid:
+            raise serializers.ValidationError(f"Unknown aggregations: {', '.join(invalid)}. Use count, sum, mean, min, max, nunique or pNN.")
+        return value
+
+    def validate(self, data):
+        if not data.get('columns') and not data.get('keys'):
+            raise serializers.ValidationError("Missing required parameters.")
+        return data
+
+
+class DescribeSerializer(serializers.Serializer):
+    csv_upload_id = serializers.IntegerField()
+    # Defaults to every numeric column
+    columns = serializers.ListField(child=serializers.CharField(), required=False, allow_empty=False)
+    percentiles = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=100), required=False, max_length=20,
+    )
+
+
+class CorrelationSerializer(serializers.Serializer):
+    csv_upload_id = serializers.IntegerField()
+    # Defaults to every numeric column
+    columns = serializers.ListField(child=serializers.CharField(), required=False, min_length=2)
+    method = serializers.ChoiceField(choices=METHODS, required=False, default='pearson')
+
+
+class PivotSerializer(serializers.Serializer):
+    csv_upload_id = serializers.IntegerField()
+    rows = serializers.ListField(child=serializers.CharField(), min_length=1)
+    columns = serializers.ListField(child=serializers.CharField(), min_length=1)
+    # {value column: [aggregations]}; without values, cells hold row counts
+    values = serializers.DictField(child=serializers.ListField(child=serializers.CharField(), min_length=1), required=False)
+    margins = serializers.BooleanField(required=False, default=False)
+    top_rows = serializers.IntegerField(required=False, min_value=1)
+    top_columns = serializers.IntegerField(required=False, min_value=1)
+    filters = FilterSerializer(many=True, required=False)
+
+    def validate_values(self, value):
+        invalid = [name for names in value.values() for name in names if name not in PIVOT_AGGREGATIONS]
+        if invalid:
+            raise serializers.ValidationError(f"Unknown aggregations: {', '.join(invalid)}. Use {', '.join(PIVOT_AGGREGATIONS)}.")
+        return {column: list(dict.fromkeys(names)) for column, names in value.items()}
+
+    def validate(self, data):
+        shared = set(data['rows']) & set(data['columns'])
+        if shared:
+            raise serializers.ValidationError(f"Keys cannot be both rows and columns: {', '.join(sorted(shared))}.")
+        return data
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import CSVUpload
+from .cache import dataframe_cache
+from .columnar import remove_sidecar
+from .uploads import is_shared
+
+
+@receiver(post_delete, sender=CSVUpload)
+def invalidate_upload_caches(sender, instance, **kwargs):
+    # Duplicate uploads share the stored file and everything derived from it
+    if is_shared(instance):
+        return
+    dataframe_cache.invalidate(instance.file.name)
+    remove_sidecar(instance)
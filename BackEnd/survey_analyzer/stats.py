@@ -0,0 +1,193 @@
+"""
+Summary statistics computed server-side for plots.
+
+Box plot statistics are computed with NumPy over the (memory-mapped) column.
+With chunk_size set, no pass holds more than one chunk of values: quartiles are
+found exactly by first counting values into fine bins, then selecting within
+the few bins that hold the wanted ranks. Ranks (for Spearman correlations) are
+found the same way, by a distribution sort over such bins.
+"""
+import tempfile
+
+import numpy as np
+
+from .binning import MAX_BINS, histogram
+
+
+def finite_chunks(values, chunk_size=None):
+    step = chunk_size or len(values) or 1
+    for start in range(0, len(values), step):
+        chunk = np.asarray(values[start:start + step], dtype=float)
+        yield chunk[~np.isnan(chunk)]
+
+
+def chunked_quantiles(values, quantiles, chunk_size, value_range):
+    """Exact quantiles (numpy's default linear interpolation) without loading all values at once."""
+    edges, counts = histogram(values, bins=MAX_BINS, value_range=value_range, chunk_size=chunk_size)
+    cumulative = np.cumsum(counts)
+    positions = (cumulative[-1] - 1) * np.asarray(quantiles)
+    ranks = sorted({int(rank) for position in positions for rank in (np.floor(position), np.ceil(position))})
+    bins = {rank: int(np.searchsorted(cumulative, rank, side='right')) for rank in ranks}
+
+    selected = {b: [] for b in set(bins.values())}
+    for chunk in finite_chunks(values, chunk_size):
+        # Same bin assignment as np.histogram: [low, high) except the last bin
+        chunk_bins = np.clip(np.searchsorted(edges, chunk, side='right') - 1, 0, len(counts) - 1)
+        for b in selected:
+            selected[b].append(chunk[chunk_bins == b])
+    selected = {b: np.sort(np.concatenate(parts)) for b, parts in selected.items()}
+
+    ordered = {}
+    for rank, b in bins.items():
+        before = cumulative[b - 1] if b else 0
+        ordered[rank] = selected[b][rank - before]
+    return [
+        ordered[int(np.floor(position))] + (position - np.floor(position)) * (ordered[int(np.ceil(position))] - ordered[int(np.floor(position))])
+        for position in positions
+    ]
+
+
+def scratch(dtype, size):
+    """Memory-mapped scratch array of size items, removed once it's no longer referenced."""
+    return np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+', shape=(max(size, 1),))[:size]
+
+
+def indexed_chunks(values, positions=None, chunk_size=None):
+    """(values, positions) of the non-missing values of each chunk; positions default to the index in values."""
+    step = chunk_size or len(values) or 1
+    for start in range(0, len(values), step):
+        chunk = np.asarray(values[start:start + step], dtype=float)
+        index = np.flatnonzero(~np.isnan(chunk))
+        yield chunk[index], (start + index if positions is None else np.asarray(positions[start:start + step])[index])
+
+
+def average_ranks(values, before=0):
+    """Average ranks of values (ties share the mean of their ranks), counting from before + 1."""
+    uniques, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return (before + np.cumsum(counts) - (counts - 1) / 2)[inverse]
+
+
+def chunked_ranks(values, out, chunk_size, positions=None, before=0):
+    """Write the average ranks of values (as pandas' rank(); NaN stays NaN) to out, a chunk at a time.
+
+    Values are counted into MAX_BINS equal-width bins, consecutive bins are
+    grouped into ranges of at most chunk_size values, and each value and its
+    position are scattered to its range in a scratch memory map. Ranges are
+    then ranked one by one: in memory, or recursively when a single bin holds
+    more than chunk_size values. positions and before place a range's ranks in
+    out when recursing.
+    """
+    count, low, high = 0, np.inf, -np.inf
+    for chunk in finite_chunks(values, chunk_size):
+        count += len(chunk)
+        if len(chunk):
+            low, high = min(low, chunk.min()), max(high, chunk.max())
+    if positions is None:
+        out[:] = np.nan
+    if not count:
+        return out
+
+    if low == high:
+        for _, where in indexed_chunks(values, positions, chunk_size):
+            out[where] = before + (count + 1) / 2
+        return out
+
+    edges = np.linspace(low, high, MAX_BINS + 1)
+
+    def bin_of(chunk):
+        return np.clip(np.searchsorted(edges, chunk, side='right') - 1, 0, MAX_BINS - 1)
+
+    counts = np.zeros(MAX_BINS, dtype=np.int64)
+    if count > chunk_size:
+        for chunk in finite_chunks(values, chunk_size):
+            counts += np.bincount(bin_of(chunk), minlength=MAX_BINS)
+    if count <= chunk_size or counts.max() == count:
+        # Fits in memory, or can't be split further
+        chunk, where = map(np.concatenate, zip(*indexed_chunks(values, positions, chunk_size)))
+        out[where] = average_ranks(chunk, before)
+        return out
+
+    range_of_bin = np.empty(MAX_BINS, dtype=np.int64)
+    current, size = 0, 0
+    for b, n in enumerate(counts):
+        if size and size + n > chunk_size:
+            current, size = current + 1, 0
+        range_of_bin[b] = current
+        size += n
+    range_counts = np.bincount(range_of_bin, weights=counts).astype(np.int64)
+    starts = np.cumsum(range_counts) - range_counts
+
+    sorted_values, sorted_positions = scratch(np.float64, count), scratch(np.int64, count)
+    cursors = starts.copy()
+    for chunk, where in indexed_chunks(values, positions, chunk_size):
+        ranges = range_of_bin[bin_of(chunk)]
+        order = np.argsort(ranges, kind='stable')
+        ranges, chunk, where = ranges[order], chunk[order], where[order]
+        present, first, sizes = np.unique(ranges, return_index=True, return_counts=True)
+        for r, i, n in zip(present, first, sizes):
+            sorted_values[cursors[r]:cursors[r] + n] = chunk[i:i + n]
+            sorted_positions[cursors[r]:cursors[r] + n] = where[i:i + n]
+            cursors[r] += n
+
+    for start, n in zip(starts, range_counts):
+        chunked_ranks(sorted_values[start:start + n], out, chunk_size, sorted_positions[start:start + n], before + start)
+    return out
+
+
+def box_statistics(values, max_outliers=100, chunk_size=None):
+    """Quartiles, Tukey whiskers (1.5 IQR), mean, sd and a uniform sample of at most max_outliers outliers.
+
+    Returns None when there are no values.
+    """
+    count = 0
+    total = 0.0
+    squares = 0.0
+    low, high = np.inf, -np.inf
+    for chunk in finite_chunks(values, chunk_size):
+        count += len(chunk)
+        total += chunk.sum()
+        squares += np.square(chunk).sum()
+        if len(chunk):
+            low, high = min(low, chunk.min()), max(high, chunk.max())
+    if not count:
+        return None
+
+    if chunk_size and chunk_size < len(values):
+        q1, median, q3 = chunked_quantiles(values, [0.25, 0.5, 0.75], chunk_size, (low, high))
+    else:
+        q1, median, q3 = np.percentile(next(finite_chunks(values)), [25, 50, 75])
+
+    lower_fence, upper_fence = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    lower_whisker, upper_whisker = np.inf, -np.inf
+    outlier_count = 0
+    outliers, keys = np.empty(0), np.empty(0)
+    rng = np.random.default_rng(0)
+    for chunk in finite_chunks(values, chunk_size):
+        inside = (chunk >= lower_fence) & (chunk <= upper_fence)
+        if inside.any():
+            lower_whisker = min(lower_whisker, chunk[inside].min())
+            upper_whisker = max(upper_whisker, chunk[inside].max())
+        # Keep the outliers with the smallest random keys: a uniform sample across all chunks
+        chunk_outliers = chunk[~inside]
+        outlier_count += len(chunk_outliers)
+        outliers = np.concatenate([outliers, chunk_outliers])
+        keys = np.concatenate([keys, rng.random(len(chunk_outliers))])
+        if len(outliers) > max_outliers:
+            keep = np.argpartition(keys, max_outliers)[:max_outliers] if max_outliers else []
+            outliers, keys = outliers[keep], keys[keep]
+
+    mean = total / count
+    return {
+        'count': count,
+        'min': float(low),
+        'max': float(high),
+        'q1': float(q1),
+        'median': float(median),
+        'q3': float(q3),
+        'lowerfence': float(lower_whisker),
+        'upperfence': float(upper_whisker),
+        'mean': float(mean),
+        'sd': float(np.sqrt(max(squares / count - mean ** 2, 0.0))),
+        'outlier_count': outlier_count,
+        'outliers': np.sort(outliers).tolist(),
+    }
@@ -1,3 +1,141 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from jigyasa.models import User
+from .cache import load_dataframe
+from .columnar import ensure_sidecar, iter_chunks
+from .describe import correlation, describe
+from .groupby import group_by, group_by_chunks
+from .models import Analysis, CSVUpload, Report
+from .pivot import pivot
+from .reports import generate_report, publish
+
+MEDIA_ROOT = tempfile.mkdtemp()
+# Fewer rows than the test files have, so the chunked paths are taken
+CHUNK_ROWS = 700
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def records(result, keys):
+    groups, rows = result
+    return groups, pd.DataFrame(rows).sort_values(keys).reset_index(drop=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ChunkedParityTests(TestCase):
+    """Uploads that don't fit the memory budget are read in chunks; results must not depend on it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(0)
+        n = 3000
+        df = pd.DataFrame({
+            'region': rng.choice(['North', 'South', 'East'], n, p=[0.7, 0.2, 0.1]),
+            'year': rng.choice([2021, 2022, 2023], n),
+            'score': rng.integers(1, 6, n).astype(float),
+            'age': rng.normal(40, 10, n).round(1),
+        })
+        df.loc[::7, 'age'] = np.nan
+        user = User.objects.create_user(username='analyst', email='analyst@example.com', password='secret')
+        cls.upload = CSVUpload.objects.create(
+            user=user, file=SimpleUploadedFile('data.csv', df.to_csv(index=False).encode(), content_type='text/csv'),
+        )
+
+    def setUp(self):
+        self.meta = ensure_sidecar(self.upload)
+
+    def chunks(self, columns):
+        return iter_chunks(self.upload, self.meta, columns, CHUNK_ROWS)
+
+    def assert_tables_equal(self, chunked, in_memory):
+        self.assertEqual(chunked['index'], in_memory['index'])
+        self.assertEqual(chunked['columns'], in_memory['columns'])
+        np.testing.assert_allclose(
+            np.array(chunked['data'], dtype=float), np.array(in_memory['data'], dtype=float), rtol=1e-9, atol=1e-12,
+        )
+
+    def test_describe(self):
+        columns = ['year', 'score', 'age']
+        in_memory = describe(self.upload, columns, [5, 50, 99.5])
+        with mock.patch('survey_analyzer.describe.chunk_rows', return_value=CHUNK_ROWS):
+            chunked = describe(self.upload, columns, [5, 50, 99.5])
+        self.assert_tables_equal(chunked, in_memory)
+
+    def test_correlation(self):
+        for method, columns in [('pearson', ['year', 'score', 'age']), ('spearman', ['year', 'score'])]:
+            in_memory = correlation(self.upload, columns, method)
+            with mock.patch('survey_analyzer.describe.chunk_rows', return_value=CHUNK_ROWS):
+                chunked = correlation(self.upload, columns, method)
+            self.assert_tables_equal(chunked, in_memory)
+
+    def test_group_by(self):
+        keys = ['region', 'year']
+        aggregations = {'score': ['mean', 'sum', 'min', 'nunique', 'p50', 'p90'], 'age': ['count', 'max', 'p25']}
+        columns = [*keys, *aggregations]
+        groups, in_memory = records(group_by(load_dataframe(self.upload, columns), keys, aggregations), keys)
+        chunked_groups, chunked = records(group_by_chunks(self.chunks(columns), keys, aggregations), keys)
+        self.assertEqual(chunked_groups, groups)
+        pd.testing.assert_frame_equal(chunked, in_memory, check_dtype=False)
+
+    def test_pivot(self):
+        values = {'score': ['count', 'mean', 'max'], 'age': ['sum']}
+        columns = ['region', 'year', 'score', 'age']
+        in_memory = pivot([load_dataframe(self.upload, columns)], ['region'], ['year'], values, margins=True)
+        chunked = pivot(self.chunks(columns), ['region'], ['year'], values, margins=True)
+        self.assertEqual(chunked['index'], in_memory['index'])
+        self.assertEqual(chunked['columns'], in_memory['columns'])
+        for name, matrix in in_memory['data'].items():
+            np.testing.assert_allclose(np.array(chunked['data'][name], dtype=float), np.array(matrix, dtype=float))
+
+
+def rendered(function, *args):
+    future = Future()
+    future.set_result(b'%PDF-1.4')
+    return future
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@mock.patch('survey_analyzer.reports.run_in_process', rendered)
+class ReportTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='author', email='author@example.com', password='secret')
+        self.analysis = Analysis.objects.create(user=user, title='First')
+
+    def edit(self, title):
+        self.analysis.title = title
+        self.analysis.save()
+
+    def test_unchanged_analysis_reuses_its_report(self):
+        report = publish(self.analysis)
+        generate_report(report.id)
+        again = publish(self.analysis)
+        self.assertEqual(again.id, report.id)
+        self.assertEqual(Report.objects.get(id=report.id).status, 'ready')
+
+    def test_new_report_supersedes_older_versions(self):
+        first = publish(self.analysis)
+        generate_report(first.id)
+        self.edit('Second')
+        second = publish(self.analysis)
+        generate_report(second.id)
+
+        self.assertEqual(list(Report.objects.values_list('id', 'status')), [(second.id, 'ready')])
+
+    def test_late_job_of_an_older_version_keeps_the_newer_report(self):
+        first = publish(self.analysis)
+        self.edit('Second')
+        second = publish(self.analysis)
+        generate_report(second.id)
+        generate_report(first.id)
+
+        self.assertEqual(list(Report.objects.values_list('id', 'status')), [(second.id, 'ready')])
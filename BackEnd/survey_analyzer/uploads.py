@@ -0,0 +1,95 @@
+"""
+Content-addressed storage of CSV uploads.
+
+Uploaded files are hashed (SHA-256) by HashingUploadHandler while Django
+streams them in, and stored once under uploads/csv/sha256/<hash>.csv.
+Uploading the same export again creates a new CSVUpload that points at the
+stored file, so it also shares the file's columnar sidecar, its cached
+columns and its cached results; its column profiles are copied from an
+upload of the same content that was already processed.
+"""
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CSVUpload, ColumnProfile
+from .columnar import content_name, read_meta
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Hashes uploaded files as they stream past, into request.upload_hashes ({field name: SHA-256}).
+
+    Must come before the handlers that store the file; it passes every chunk on unchanged.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_hashes'):
+            self.request.upload_hashes = {}
+        self.request.upload_hashes[self.field_name] = self.digest.hexdigest()
+        return None
+
+
+def uploaded_file_hash(uploaded_file):
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def store_content(uploaded_file, sha256):
+    """Storage name of uploaded_file in the content-addressed store, saving it only if it is new."""
+    name = content_name(sha256)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, uploaded_file)
+        if saved != name:
+            # Another request stored the same content first
+            default_storage.delete(saved)
+    return name
+
+
+def is_shared(csv_upload):
+    """Whether another upload uses the same stored file."""
+    return CSVUpload.objects.filter(file=csv_upload.file.name).exclude(id=csv_upload.id).exists()
+
+
+def reuse_profiles(csv_upload, sha256):
+    """Copy profiles from a processed upload of the same content and mark csv_upload ready; False if there is none."""
+    sources = (
+        CSVUpload.objects.filter(content_hash=sha256, status='ready', row_count__isnull=False)
+        .exclude(id=csv_upload.id).order_by('-id')
+    )
+    # Stored content is never rewritten; files stored elsewhere (older uploads) must still match their sidecar
+    source = sources.filter(file=csv_upload.file.name).first() or next(
+        (source for source in sources[:10] if (read_meta(source) or {}).get('sha256') == sha256), None,
+    )
+    if source is None:
+        return False
+    with transaction.atomic():
+        ColumnProfile.objects.filter(csv_upload=csv_upload).delete()
+        ColumnProfile.objects.bulk_create(
+            ColumnProfile(
+                csv_upload=csv_upload, name=profile.name, position=profile.position, dtype=profile.dtype,
+                null_count=profile.null_count, distinct_count=profile.distinct_count,
+                distinct_approximate=profile.distinct_approximate,
+                min_value=profile.min_value, max_value=profile.max_value, mean=profile.mean,
+                top_values=profile.top_values,
+            )
+            for profile in source.column_profiles.all()
+        )
+        CSVUpload.objects.filter(id=csv_upload.id).update(
+            status='ready', processing_error='', row_count=source.row_count, content_hash=sha256,
+            status_updated_at=timezone.now(),
+        )
+    return True
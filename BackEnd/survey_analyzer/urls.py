@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CSVUploadViewSet, AnalysisViewSet, PlotDataView, GroupByView, PublishAnalysisView
+from .views import CSVUploadViewSet, AnalysisViewSet, PlotDataView, BatchPlotDataView, GroupByView, PivotView, DescribeView, CorrelationView, PublishAnalysisView, ReportView, ReportDownloadView, AnalyzerCacheStatsView
 
 router = DefaultRouter()
 router.register(r'csv-uploads', CSVUploadViewSet, basename='csv-upload')
@@ -8,7 +8,14 @@ router.register(r'analyses', AnalysisViewSet, basename='analysis')
 
 urlpatterns = [
     path('plot-data/', PlotDataView.as_view(), name='plot-data'),
+    path('plot-data/batch/', BatchPlotDataView.as_view(), name='plot-data-batch'),
     path('groupby/', GroupByView.as_view(), name='groupby'),
+    path('pivot/', PivotView.as_view(), name='pivot'),
+    path('describe/', DescribeView.as_view(), name='describe'),
+    path('correlation/', CorrelationView.as_view(), name='correlation'),
+    path('cache-stats/', AnalyzerCacheStatsView.as_view(), name='cache-stats'),
     path('', include(router.urls)),
     path('publish-analysis/', PublishAnalysisView.as_view(), name='publish-analysis'),
+    path('publish-analysis/<int:report_id>/', ReportView.as_view(), name='report'),
+    path('publish-analysis/<int:report_id>/download/', ReportDownloadView.as_view(), name='report-download'),
 ]
\ No newline at end of file
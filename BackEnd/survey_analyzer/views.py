@@ -1,50 +1,118 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import CSVUpload, Analysis
-from .serializers import CSVUploadSerializer, AnalysisSerializer, PlotDataSerializer
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .models import CSVUpload, Analysis, Plot, Report
+from .serializers import CSVUploadSerializer, AnalysisSerializer, AnalysisSummarySerializer, ReportSerializer, PlotDataSerializer, BatchPlotDataSerializer, GroupBySerializer, DescribeSerializer, CorrelationSerializer, PivotSerializer
+from .cache import load_dataframe, filter_dataframe, dataframe_cache, UploadNotReady
+from .jobs import submit, process_upload, resume_lost_upload
+from .profiling import column_profiles
+from .downsampling import downsample
+from .binning import histogram, grid_axis, grid_aggregate
+from .encoding import encode_array
+from .stats import box_statistics
+from .groupby import cached_group_by
+from .describe import cached_describe, cached_correlation, numeric_columns
+from .pivot import cached_pivot, PivotTooLarge
+from .columnar import chunk_size_for, ensure_sidecar
+from .filters import FilterError
+from .results import result_cache, result_key
+from .reports import publish, resume_lost
+from .uploads import HashingUploadHandler, reuse_profiles, store_content, uploaded_file_hash
+from .renderers import FastJSONRenderer
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from jigyasa.throttling import OrganizationAnalyzerThrottle
 import pandas as pd
+import numpy as np
+from pandas.api.types import is_numeric_dtype
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Create your views here.
 
+
+def plot_summaries():
+    """Prefetch of an analysis' plots without their (possibly large) data."""
+    return Prefetch('related_plots', queryset=Plot.objects.defer('data'))
+
+
 class CSVUploadViewSet(viewsets.ModelViewSet):
-    queryset = CSVUpload.objects.all()
+    queryset = CSVUpload.objects.prefetch_related('column_profiles')
     serializer_class = CSVUploadSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrganizationAnalyzerThrottle]
+
+    def get_queryset(self):
+        # Profiles include top values, i.e. cells of the file; only the owner may see them
+        return self.queryset.filter(user=self.request.user)
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Hash uploads while they stream in, before they are written anywhere
+        request.upload_handlers.insert(0, HashingUploadHandler(request))
+        return super().initialize_request(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        csv_upload = self.get_object()
+        # Clients poll here while an upload is processed; restart its job if a restart lost it
+        resume_lost_upload(csv_upload)
+        return Response(self.get_serializer(csv_upload).data)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Identical content is stored once and shared by every upload of it
+        uploaded_file = serializer.validated_data['file']
+        sha256 = getattr(self.request, 'upload_hashes', {}).get('file') or uploaded_file_hash(uploaded_file)
+        serializer.save(
+            user=self.request.user, status='pending', status_updated_at=timezone.now(),
+            file=store_content(uploaded_file, sha256), content_hash=sha256,
+        )
+        return sha256
 
     def create(self, request, *args, **kwargs):
+        # Django's upload handlers have already streamed large files to disk in chunks
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        sha256 = self.perform_create(serializer)
         csv_upload = serializer.instance
         file_path = csv_upload.file.path
 
         logger.info(f"Uploaded file path: {file_path}")
 
         try:
-            df = pd.read_csv(file_path)
-            columns = df.columns.tolist()
+            # Only the header is read here; parsing and conversion run in the background
+            columns = pd.read_csv(file_path, nrows=0).columns.tolist()
             logger.info(f"Extracted columns: {columns}")
-            return Response({"id": serializer.instance.id, "columns": columns}, status=status.HTTP_201_CREATED)
         except Exception as e:
             logger.error(f"Error processing file: {e}")
+            CSVUpload.objects.filter(id=csv_upload.id).update(status='failed', processing_error=str(e), status_updated_at=timezone.now())
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        if reuse_profiles(csv_upload, sha256):
+            csv_upload.status = 'ready'
+        else:
+            transaction.on_commit(lambda: submit(process_upload, csv_upload.id))
+        return Response({"id": csv_upload.id, "columns": columns, "status": csv_upload.status}, status=status.HTTP_201_CREATED)
+
 
 class AnalysisViewSet(viewsets.ModelViewSet):
+    """Analyses of the current user; the list only carries plot titles, plot data is returned per analysis."""
     queryset = Analysis.objects.all()
     serializer_class = AnalysisSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action == 'list':
+            return queryset.prefetch_related(plot_summaries())
+        return queryset.prefetch_related('related_plots')
+
+    def get_serializer_class(self):
+        return AnalysisSummarySerializer if self.action == 'list' else AnalysisSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -59,6 +127,8 @@ import os
 
 class PlotDataView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    throttle_classes = [OrganizationAnalyzerThrottle]
 
     def post(self, request, *args, **kwargs):
         logger.info(f"Incoming request payload: {request.data}")
@@ -68,133 +138,517 @@ class PlotDataView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         validated_data = serializer.validated_data
-        plot_type = validated_data.get('plot_type')
-        x_axis = validated_data.get('x_axis')
-        y_axes = validated_data.get('y_axes', [])
-        csv_upload_id = validated_data.get('csv_upload_id')
+        try:
+            csv_upload = CSVUpload.objects.get(id=validated_data.get('csv_upload_id'), user=request.user)
+        except CSVUpload.DoesNotExist:
+            return Response({"error": "CSV file not found."}, status=status.HTTP_404_NOT_FOUND)
+        return cached_plot(csv_upload, validated_data)
+
+
+def cached_plot(csv_upload, validated_data, df=None):
+    """build_plot() through the persistent result cache; only successful plots are stored."""
+    try:
+        key = result_key(csv_upload, 'plot', {name: value for name, value in validated_data.items() if name != 'csv_upload_id'})
+    except UploadNotReady as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return Response(cached, status=status.HTTP_200_OK)
+
+    response = build_plot(csv_upload, validated_data, df)
+    if response.status_code == status.HTTP_200_OK:
+        result_cache.put(key, response.data)
+    return response
+
+
+def plot_columns(validated_data):
+    return [validated_data.get('x_axis'), *validated_data.get('y_axes', []), validated_data.get('value_column')]
+
+
+def build_plot(csv_upload, validated_data, df=None):
+    """Response with one plot for validated PlotDataSerializer data.
+
+    df, when given, already holds the upload's (unfiltered) columns, as loaded once for a batch.
+    """
+    plot_type = validated_data.get('plot_type')
+    x_axis = validated_data.get('x_axis')
+    y_axes = validated_data.get('y_axes', [])
+    max_points = validated_data.get('max_points')
+    filters = validated_data.get('filters')
+    binary = validated_data.get('encoding') == 'binary'
+
+    try:
+        if df is None:
+            df = load_dataframe(csv_upload, plot_columns(validated_data), filters)
+        else:
+            df = filter_dataframe(csv_upload, df, filters)
+
+        if plot_type in ['scatter', 'bar', 'line', 'area']:
+            if x_axis not in df.columns or any(y not in df.columns for y in y_axes):
+                return Response({"error": "Invalid columns selected for x_axis or y_axes."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if plot_type == 'pie':
+            if not x_axis:
+                return Response({"error": "x_axis is required for pie charts."}, status=status.HTTP_400_BAD_REQUEST)
+            if x_axis not in df.columns:
+                return Response({"error": "Invalid column selected for x_axis."}, status=status.HTTP_400_BAD_REQUEST)
+            if y_axes and len(y_axes) > 1:
+                return Response({"error": "Pie chart supports only one Y-axis variable."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Checked against the stored profile instead of rescanning the column, unless rows were filtered out
+            x_profile = column_profiles(csv_upload)[x_axis]
+            if filters or x_profile.distinct_approximate:
+                not_unique = df[x_axis].hasnans or not df[x_axis].is_unique
+            else:
+                not_unique = x_profile.null_count or x_profile.distinct_count != csv_upload.row_count
+            if not_unique:
+                return Response({"error": "x_axis must have unique values for pie charts."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Every value is unique and present, so the column itself is the list of labels
+            unique_labels = df[x_axis]
+
+            data = [{
+                "values": encode_array(df[y_axes[0]] if y_axes else df[x_axis].value_counts(), binary),
+                "labels": unique_labels.tolist(),
+                "type": "pie",
+            }]
+
+            logger.info(f"Pie Chart Data: labels={unique_labels.tolist()}, values={df[y_axes[0]].tolist() if y_axes else df[x_axis].value_counts().tolist()}")
+
+        elif plot_type == 'heatmap' and validated_data.get('heatmap_mode') == 'correlation':
+            if len(y_axes) < 2:
+                return Response({"error": "At least two y_axes are required for a correlation heatmap."}, status=status.HTTP_400_BAD_REQUEST)
+            if any(y not in df.columns for y in y_axes):
+                return Response({"error": "Invalid columns selected for y_axes."}, status=status.HTTP_400_BAD_REQUEST)
+            if any(not is_numeric_dtype(df[y].dtype) for y in y_axes):
+                return Response({"error": "Correlation heatmaps require numeric columns."}, status=status.HTTP_400_BAD_REQUEST)
+
+            matrix = df[y_axes].corr()
+            data = [{
+                "z": encode_array(matrix.to_numpy(), binary),
+                "x": y_axes,
+                "y": y_axes,
+                "zmin": -1,
+                "zmax": 1,
+                "type": "heatmap",
+            }]
+
+        elif plot_type == 'heatmap' and validated_data.get('heatmap_mode') == 'grid':
+            value_column = validated_data.get('value_column')
+            aggregate = validated_data.get('aggregate', 'mean' if value_column else 'count')
+            if not x_axis or not y_axes:
+                return Response({"error": "x_axis and y_axes are required for heatmaps."}, status=status.HTTP_400_BAD_REQUEST)
+            if len(y_axes) > 1:
+                return Response({"error": "Grid heatmaps support only one Y-axis variable."}, status=status.HTTP_400_BAD_REQUEST)
+            if any(column not in df.columns for column in [x_axis, y_axes[0], value_column] if column):
+                return Response({"error": "Invalid columns selected for x_axis, y_axes or value_column."}, status=status.HTTP_400_BAD_REQUEST)
+            if aggregate != 'count' and not is_numeric_dtype(df[value_column].dtype):
+                return Response({"error": "value_column must be numeric for mean and sum."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Axis ranges and cardinalities come from the stored profiles
+            profiles = column_profiles(csv_upload)
+            grid_size = validated_data.get('grid_size', 50)
+            try:
+                axes = [
+                    grid_axis(df[column], grid_size, (profiles[column].min_value, profiles[column].max_value), profiles[column].distinct_count)
+                    for column in [x_axis, y_axes[0]]
+                ]
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            (x_codes, x_labels), (y_codes, y_labels) = axes
+
+            data = [{
+                "z": grid_aggregate(
+                    x_codes, y_codes, (len(x_labels), len(y_labels)), aggregate,
+                    df[value_column].to_numpy() if aggregate != 'count' else None,
+                ),
+                "x": x_labels,
+                "y": y_labels,
+                "type": "heatmap",
+                "name": f"{aggregate} of {value_column}" if aggregate != 'count' else "count",
+            }]
+
+        elif plot_type == 'heatmap':
+            if not x_axis or not y_axes:
+                return Response({"error": "x_axis and y_axes are required for heatmaps."}, status=status.HTTP_400_BAD_REQUEST)
+            if x_axis not in df.columns or any(y not in df.columns for y in y_axes):
+                return Response({"error": "Invalid columns selected for x_axis or y_axes."}, status=status.HTTP_400_BAD_REQUEST)
+
+            profiles = column_profiles(csv_upload)
+            if filters:
+                has_nulls = df[[x_axis, *y_axes]].isna().any().any()
+            else:
+                has_nulls = any(profiles[column].null_count for column in [x_axis, *y_axes])
+            if has_nulls:
+                return Response({"error": "x_axis and y_axes must not contain null values for heatmaps."}, status=status.HTTP_400_BAD_REQUEST)
+
+            data = [{
+                "z": encode_array(df[y_axes].values, binary),
+                "x": encode_array(df[x_axis], binary),
+                "y": y_axes,
+                "type": "heatmap",
+            }]
+
+            logger.info(f"Heatmap Data: x={df[x_axis].tolist()}, y={y_axes}, z={df[y_axes].values.tolist()}")
+
+        elif plot_type == 'histogram':
+            if not y_axes:
+                return Response({"error": "y_axes are required for histograms."}, status=status.HTTP_400_BAD_REQUEST)
+            if any(y not in df.columns for y in y_axes):
+                return Response({"error": "Invalid columns selected for y_axes."}, status=status.HTTP_400_BAD_REQUEST)
+            if any(not is_numeric_dtype(df[y].dtype) for y in y_axes):
+                return Response({"error": "Histograms require numeric columns."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # The stored profile gives each column's range without another scan
+            profiles = column_profiles(csv_upload)
+            data = []
+            for y_axis in y_axes:
+                try:
+                    edges, counts = histogram(
+                        df[y_axis].to_numpy(),
+                        bins=validated_data.get('bins', 'auto'),
+                        bin_width=validated_data.get('bin_width'),
+                        # Filtered rows may cover a narrower range than the whole column
+                        value_range=None if filters else (profiles[y_axis].min_value, profiles[y_axis].max_value),
+                        chunk_size=validated_data.get('chunk_size') or chunk_size_for(csv_upload, [y_axis]),
+                    )
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                data.append({
+                    "x": encode_array((edges[:-1] + edges[1:]) / 2, binary),
+                    "y": encode_array(counts, binary),
+                    "width": encode_array(np.diff(edges), binary),
+                    "type": "bar",
+                    "name": y_axis,
+                    "meta": {"bin_edges": encode_array(edges, binary)},
+                })
+
+        else:
+            data = []
+
+            for y_axis in y_axes:
+                if plot_type in ['scatter', 'line', 'area']:
+                    x_values, y_values = df[x_axis], df[y_axis]
+                    if max_points:
+                        method = validated_data.get('downsample') or ('minmax' if plot_type == 'scatter' else 'lttb')
+                        x_values, y_values = downsample(x_values, y_values, max_points, method)
+
+                if plot_type == 'scatter':
+                    data.append({
+                        "x": encode_array(x_values, binary),
+                        "y": encode_array(y_values, binary),
+                        "type": "scatter",
+                        "mode": "lines+markers",
+                        "name": y_axis,
+                    })
+                elif plot_type == 'line':
+                    data.append({
+                        "x": encode_array(x_values, binary),
+                        "y": encode_array(y_values, binary),
+                        "type": "scatter",
+                        "mode": "lines",
+                        "name": y_axis,
+                    })
+                elif plot_type == 'bar':
+                    data.append({
+                        "x": encode_array(df[x_axis], binary),
+                        "y": encode_array(df[y_axis], binary),
+                        "type": "bar",
+                        "name": y_axis,
+                    })
+                elif plot_type == 'box' and validated_data.get('box_stats'):
+                    if y_axis not in df.columns or not is_numeric_dtype(df[y_axis].dtype):
+                        return Response({"error": "Box statistics require numeric columns."}, status=status.HTTP_400_BAD_REQUEST)
+                    stats = box_statistics(
+                        df[y_axis].to_numpy(),
+                        validated_data.get('max_outliers', 100),
+                        validated_data.get('chunk_size') or chunk_size_for(csv_upload, [y_axis]),
+                    )
+                    if stats is None:
+                        continue
+                    data.append({
+                        "x": [y_axis],
+                        **{key: [stats[key]] for key in ['q1', 'median', 'q3', 'lowerfence', 'upperfence', 'mean', 'sd']},
+                        "type": "box",
+                        "boxpoints": False,
+                        "name": y_axis,
+                        "meta": {key: stats[key] for key in ['count', 'min', 'max', 'outlier_count']},
+                    })
+                    if stats['outliers']:
+                        data.append({
+                            "x": [y_axis] * len(stats['outliers']),
+                            "y": encode_array(np.asarray(stats['outliers']), binary),
+                            "type": "scatter",
+                            "mode": "markers",
+                            "name": f"{y_axis} outliers",
+                            "showlegend": False,
+                        })
+                elif plot_type == 'box':
+                    data.append({
+                        "y": encode_array(df[y_axis], binary),
+                        "type": "box",
+                        "name": y_axis,
+                    })
+                elif plot_type == 'area':
+                    data.append({
+                        "x": encode_array(x_values, binary),
+                        "y": encode_array(y_values, binary),
+                        "type": "scatter",
+                        "fill": "tozeroy",
+                        "name": y_axis,
+                    })
+
+        layout = {
+            "title": f"{', '.join(y_axes)} vs {x_axis}" if plot_type != 'pie' else f"Pie Chart of {x_axis}",
+            "xaxis": {"title": x_axis} if plot_type not in ['pie', 'heatmap'] else None,
+            "yaxis": {"title": ', '.join(y_axes)} if plot_type not in ['pie', 'heatmap'] else None,
+        }
+        if plot_type == 'heatmap' and validated_data.get('heatmap_mode') == 'correlation':
+            layout["title"] = f"Correlation of {', '.join(y_axes)}"
+        elif plot_type == 'heatmap' and validated_data.get('heatmap_mode') == 'grid':
+            layout.update({"xaxis": {"title": x_axis}, "yaxis": {"title": y_axes[0]}})
+        if plot_type == 'histogram':
+            layout.update({
+                "title": f"Histogram of {', '.join(y_axes)}",
+                "xaxis": {"title": ', '.join(y_axes)},
+                "yaxis": {"title": "Count"},
+                "barmode": "overlay",
+            })
+
+        return Response({"data": data, "layout": layout}, status=status.HTTP_200_OK)
+    except UploadNotReady as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except FilterError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class BatchPlotDataView(APIView):
+    """Several plots of one upload (e.g. a whole dashboard), with the needed columns loaded once."""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    throttle_classes = [OrganizationAnalyzerThrottle]
+
+    def post(self, request, *args, **kwargs):
+        serializer = BatchPlotDataSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            csv_upload = CSVUpload.objects.get(id=csv_upload_id, user=request.user)
-            file_path = csv_upload.file.path
+            csv_upload = CSVUpload.objects.prefetch_related('column_profiles').get(
+                id=serializer.validated_data['csv_upload_id'], user=request.user,
+            )
+        except CSVUpload.DoesNotExist:
+            return Response({"error": "CSV file not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            df = pd.read_csv(file_path)
+        specs = []
+        for plot in serializer.validated_data['plots']:
+            plot_serializer = PlotDataSerializer(data={**plot, 'csv_upload_id': csv_upload.id})
+            specs.append((plot_serializer.is_valid(), plot_serializer))
+        valid = [plot_serializer.validated_data for is_valid, plot_serializer in specs if is_valid]
 
-            if plot_type in ['scatter', 'bar', 'line', 'area', 'heatmap']:
-                if x_axis not in df.columns or any(y not in df.columns for y in y_axes):
-                    return Response({"error": "Invalid columns selected for x_axis or y_axes."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            df = load_dataframe(csv_upload, [column for spec in valid for column in plot_columns(spec)])
+            column_profiles(csv_upload)
+        except UploadNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        def run(spec):
+            is_valid, plot_serializer = spec
+            if not is_valid:
+                return {"error": plot_serializer.errors, "status": status.HTTP_400_BAD_REQUEST}
+            try:
+                response = cached_plot(csv_upload, plot_serializer.validated_data, df)
+            finally:
+                if serializer.validated_data['parallel']:
+                    connections.close_all()
+            return response.data if response.status_code == status.HTTP_200_OK else {**response.data, "status": response.status_code}
+
+        if serializer.validated_data['parallel'] and len(specs) > 1:
+            workers = min(len(specs), getattr(settings, 'ANALYZER_BATCH_WORKERS', 4))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analyzer-batch') as executor:
+                plots = list(executor.map(run, specs))
+        else:
+            plots = [run(spec) for spec in specs]
+        return Response({"plots": plots}, status=status.HTTP_200_OK)
+
+
+class AnalyzerCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
 
-            if plot_type == 'pie':
-                if not x_axis:
-                    return Response({"error": "x_axis is required for pie charts."}, status=status.HTTP_400_BAD_REQUEST)
-                if x_axis not in df.columns:
-                    return Response({"error": "Invalid column selected for x_axis."}, status=status.HTTP_400_BAD_REQUEST)
-                if y_axes and len(y_axes) > 1:
-                    return Response({"error": "Pie chart supports only one Y-axis variable."}, status=status.HTTP_400_BAD_REQUEST)
+    def get(self, request, *args, **kwargs):
+        return Response({"dataframes": dataframe_cache.stats(), "results": result_cache.stats()}, status=status.HTTP_200_OK)
 
-                unique_labels = df[x_axis].dropna().unique()
-                if len(unique_labels) != len(df[x_axis]):
-                    return Response({"error": "x_axis must have unique values for pie charts."}, status=status.HTTP_400_BAD_REQUEST)
 
-                data = [{
-                    "values": df[y_axes[0]].tolist() if y_axes else df[x_axis].value_counts().tolist(),
-                    "labels": unique_labels.tolist(),
-                    "type": "pie",
-                }]
+class GroupByView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [OrganizationAnalyzerThrottle]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
-                logger.info(f"Pie Chart Data: labels={unique_labels.tolist()}, values={df[y_axes[0]].tolist() if y_axes else df[x_axis].value_counts().tolist()}")
+    def post(self, request, *args, **kwargs):
+        serializer = GroupBySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            elif plot_type == 'heatmap':
-                if not x_axis or not y_axes:
-                    return Response({"error": "x_axis and y_axes are required for heatmaps."}, status=status.HTTP_400_BAD_REQUEST)
-                if x_axis not in df.columns or any(y not in df.columns for y in y_axes):
-                    return Response({"error": "Invalid columns selected for x_axis or y_axes."}, status=status.HTTP_400_BAD_REQUEST)
+        validated_data = serializer.validated_data
+        columns = validated_data.get('columns', [])
+        keys = validated_data.get('keys', [])
+        aggregations = validated_data.get('aggregations', {})
 
-                if df[x_axis].isnull().any() or df[y_axes].isnull().any().any():
-                    return Response({"error": "x_axis and y_axes must not contain null values for heatmaps."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            csv_upload = CSVUpload.objects.get(id=validated_data['csv_upload_id'], user=request.user)
+            # Validated against the stored profiles; the data is only read on a cache miss
+            available = column_profiles(csv_upload)
+
+            if keys:
+                for column in [*keys, *aggregations]:
+                    if column not in available:
+                        return Response({"error": f"Invalid column selected: {column}"}, status=status.HTTP_400_BAD_REQUEST)
+                names = ['count', *keys, *(f'{column}_{name}' for column, names in aggregations.items() for name in names)]
+                if validated_data.get('sort_by') and validated_data['sort_by'] not in names:
+                    return Response({"error": f"sort_by must be one of: {', '.join(names)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+                try:
+                    groups, rows = cached_group_by(
+                        csv_upload, keys, aggregations,
+                        sort_by=validated_data.get('sort_by'),
+                        ascending=validated_data['ascending'],
+                        limit=validated_data.get('limit'),
+                        filters=validated_data.get('filters'),
+                    )
+                except TypeError as e:
+                    # e.g. a mean over a text column
+                    return Response({"error": f"Aggregation not supported for these columns: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({"keys": keys, "groups": groups, "rows": rows}, status=status.HTTP_200_OK)
 
-                data = [{
-                    "z": df[y_axes].values.tolist(),
-                    "x": df[x_axis].tolist(),
-                    "y": y_axes,
-                    "type": "heatmap",
-                }]
+            results = {}
+            for column in columns:
+                if (column not in available):
+                    return Response({"error": f"Invalid column selected: {column}"}, status=status.HTTP_400_BAD_REQUEST)
 
-                logger.info(f"Heatmap Data: x={df[x_axis].tolist()}, y={y_axes}, z={df[y_axes].values.tolist()}")
+                # Row counts per value, ordered by value
+                results[column] = cached_group_by(csv_upload, [column], {}, sort_by=column, ascending=True, filters=validated_data.get('filters'))[1]
 
-            else:
-                data = []
+            return Response(results, status=status.HTTP_200_OK)
+        except CSVUpload.DoesNotExist:
+            return Response({"error": "CSV file not found."}, status=status.HTTP_404_NOT_FOUND)
+        except UploadNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except FilterError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                for y_axis in y_axes:
-                    if plot_type == 'scatter':
-                        data.append({
-                            "x": df[x_axis].tolist(),
-                            "y": df[y_axis].tolist(),
-                            "type": "scatter",
-                            "mode": "lines+markers",
-                            "name": y_axis,
-                        })
-                    elif plot_type == 'bar':
-                        data.append({
-                            "x": df[x_axis].tolist(),
-                            "y": df[y_axis].tolist(),
-                            "type": "bar",
-                            "name": y_axis,
-                        })
-                    elif plot_type == 'box':
-                        data.append({
-                            "y": df[y_axis].tolist(),
-                            "type": "box",
-                            "name": y_axis,
-                        })
-                    elif plot_type == 'area':
-                        data.append({
-                            "x": df[x_axis].tolist(),
-                            "y": df[y_axis].tolist(),
-                            "type": "scatter",
-                            "fill": "tozeroy",
-                            "name": y_axis,
-                        })
 
-            layout = {
-                "title": f"{', '.join(y_axes)} vs {x_axis}" if plot_type != 'pie' else f"Pie Chart of {x_axis}",
-                "xaxis": {"title": x_axis} if plot_type not in ['pie', 'heatmap'] else None,
-                "yaxis": {"title": ', '.join(y_axes)} if plot_type not in ['pie', 'heatmap'] else None,
-            }
+class PivotView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [OrganizationAnalyzerThrottle]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def post(self, request, *args, **kwargs):
+        serializer = PivotSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({"data": data, "layout": layout}, status=status.HTTP_200_OK)
+        validated_data = serializer.validated_data
+        rows = validated_data['rows']
+        columns = validated_data['columns']
+        values = validated_data.get('values', {})
+
+        try:
+            csv_upload = CSVUpload.objects.get(id=validated_data['csv_upload_id'], user=request.user)
+            available = column_profiles(csv_upload)
+            for column in [*rows, *columns, *values]:
+                if column not in available:
+                    return Response({"error": f"Invalid column selected: {column}"}, status=status.HTTP_400_BAD_REQUEST)
+            numeric = numeric_columns(ensure_sidecar(csv_upload))
+            for column, names in values.items():
+                if column not in numeric and set(names) - {'count'}:
+                    return Response({"error": f"Only count is supported for non-numeric column: {column}"}, status=status.HTTP_400_BAD_REQUEST)
+
+            result = cached_pivot(
+                csv_upload, rows, columns, values,
+                margins=validated_data['margins'],
+                top_rows=validated_data.get('top_rows'),
+                top_columns=validated_data.get('top_columns'),
+                filters=validated_data.get('filters'),
+            )
+            return Response(result, status=status.HTTP_200_OK)
         except CSVUpload.DoesNotExist:
             return Response({"error": "CSV file not found."}, status=status.HTTP_404_NOT_FOUND)
+        except UploadNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except (FilterError, PivotTooLarge) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class GroupByView(APIView):
+def numeric_selection(csv_upload, columns):
+    """columns (default: every numeric column) after checking they exist and are numeric; an error Response otherwise."""
+    available = column_profiles(csv_upload)
+    numeric = numeric_columns(ensure_sidecar(csv_upload))
+    if not columns:
+        return numeric, None
+    for column in columns:
+        if column not in available:
+            return None, Response({"error": f"Invalid column selected: {column}"}, status=status.HTTP_400_BAD_REQUEST)
+        if column not in numeric:
+            return None, Response({"error": f"Column is not numeric: {column}"}, status=status.HTTP_400_BAD_REQUEST)
+    return list(dict.fromkeys(columns)), None
+
+
+class DescribeView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrganizationAnalyzerThrottle]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def post(self, request, *args, **kwargs):
-        columns = request.data.get('columns', [])
-        csv_upload_id = request.data.get('csv_upload_id')
-
-        if not columns or not csv_upload_id:
-            return Response({"error": "Missing required parameters."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = DescribeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        validated_data = serializer.validated_data
         try:
-            csv_upload = CSVUpload.objects.get(id=csv_upload_id, user=request.user)
-            file_path = csv_upload.file.path
+            csv_upload = CSVUpload.objects.get(id=validated_data['csv_upload_id'], user=request.user)
+            columns, error = numeric_selection(csv_upload, validated_data.get('columns'))
+            if error:
+                return error
+            if not columns:
+                return Response({"error": "The file has no numeric columns."}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(cached_describe(csv_upload, columns, validated_data.get('percentiles')), status=status.HTTP_200_OK)
+        except CSVUpload.DoesNotExist:
+            return Response({"error": "CSV file not found."}, status=status.HTTP_404_NOT_FOUND)
+        except UploadNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            df = pd.read_csv(file_path)
 
-            results = {}
-            for column in columns:
-                if (column not in df.columns):
-                    return Response({"error": f"Invalid column selected: {column}"}, status=status.HTTP_400_BAD_REQUEST)
+class CorrelationView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [OrganizationAnalyzerThrottle]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
-                grouped_data = df.groupby(column).size().reset_index(name='count')
-                results[column] = grouped_data.to_dict(orient='records')
+    def post(self, request, *args, **kwargs):
+        serializer = CorrelationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(results, status=status.HTTP_200_OK)
+        validated_data = serializer.validated_data
+        try:
+            csv_upload = CSVUpload.objects.get(id=validated_data['csv_upload_id'], user=request.user)
+            columns, error = numeric_selection(csv_upload, validated_data.get('columns'))
+            if error:
+                return error
+            if len(columns) < 2:
+                return Response({"error": "At least two numeric columns are required."}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(cached_correlation(csv_upload, columns, validated_data['method']), status=status.HTTP_200_OK)
         except CSVUpload.DoesNotExist:
             return Response({"error": "CSV file not found."}, status=status.HTTP_404_NOT_FOUND)
+        except UploadNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -205,16 +659,14 @@ from rest_framework.response import Response
 from rest_framework import status
 from .models import Analysis
 from .serializers import AnalysisSerializer
-from django.http import JsonResponse, HttpResponse
-from django.core.files.base import ContentFile
-import pdfkit
+from django.http import FileResponse
 
 class AnalysisView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        analyses = Analysis.objects.filter(user=request.user)
-        serializer = AnalysisSerializer(analyses, many=True)
+        analyses = Analysis.objects.filter(user=request.user).prefetch_related(plot_summaries())
+        serializer = AnalysisSummarySerializer(analyses, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
@@ -225,7 +677,9 @@ class AnalysisView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class PublishAnalysisView(APIView):
+    """Start publishing an analysis as a PDF; an unchanged analysis gets its existing report back."""
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrganizationAnalyzerThrottle]
 
     def post(self, request, *args, **kwargs):
         analysis_id = request.data.get('analysis_id')
@@ -233,25 +687,41 @@ class PublishAnalysisView(APIView):
             return Response({"error": "Analysis ID is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            analysis = Analysis.objects.get(id=analysis_id, user=request.user)
-            html_content = f"""
-            <html>
-            <head><title>{analysis.title}</title></head>
-            <body>
-                <h1>{analysis.title}</h1>
-                <p><strong>Author:</strong> {analysis.author_name}</p>
-                <p><strong>Date:</strong> {analysis.date}</p>
-                <p>{analysis.description}</p>
-                <h2>Plots</h2>
-                {''.join([f'<div><h3>{plot.get('title', 'Untitled')}</h3><p>{plot.get('description', '')}</p></div>' for plot in analysis.plots])}
-            </body>
-            </html>
-            """
-            pdf_file = pdfkit.from_string(html_content, False)
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{analysis.title}.pdf"'
-            return response
+            analysis = Analysis.objects.prefetch_related('related_plots').get(id=analysis_id, user=request.user)
+            report = publish(analysis)
         except Analysis.DoesNotExist:
             return Response({"error": "Analysis not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        serializer = ReportSerializer(report, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK if report.status == 'ready' else status.HTTP_202_ACCEPTED)
+
+
+class ReportView(APIView):
+    """Status of a report started by publish-analysis/."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, report_id, *args, **kwargs):
+        try:
+            report = Report.objects.get(id=report_id, analysis__user=request.user)
+        except Report.DoesNotExist:
+            return Response({"error": "Report not found."}, status=status.HTTP_404_NOT_FOUND)
+        resume_lost(report)
+        return Response(ReportSerializer(report, context={'request': request}).data, status=status.HTTP_200_OK)
+
+
+class ReportDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, report_id, *args, **kwargs):
+        try:
+            report = Report.objects.select_related('analysis').get(id=report_id, analysis__user=request.user)
+        except Report.DoesNotExist:
+            return Response({"error": "Report not found."}, status=status.HTTP_404_NOT_FOUND)
+        if report.status != 'ready':
+            return Response({"error": f"Report is {report.status}."}, status=status.HTTP_409_CONFLICT)
+        return FileResponse(
+            report.file.open('rb'), as_attachment=True,
+            filename=f"{report.analysis.title}.pdf", content_type='application/pdf',
+        )
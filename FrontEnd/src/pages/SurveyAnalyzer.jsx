@@ -2,6 +2,10 @@ import React, { useState } from 'react';
 import axios from 'axios';
 import Plot from 'react-plotly.js';
 
+// Background jobs are polled once a second, for up to ten minutes
+const POLL_INTERVAL_MS = 1000;
+const MAX_POLLS = 600;
+
 const SurveyAnalyzer = () => {
   const [columns, setColumns] = useState([]);
   const [plots, setPlots] = useState([]);
@@ -20,14 +24,28 @@ const SurveyAnalyzer = () => {
 
     setLoading(true);
     setError(null);
+    setColumns([]);
+    setCsvUploadId(null);
 
     try {
+      const headers = { 'Authorization': `Bearer ${localStorage.getItem('access_token')}` };
       const response = await axios.post('http://localhost:8000/survey-analyzer/csv-uploads/', formData, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('access_token')}`,
-          'Content-Type': 'multipart/form-data',
-        },
+        headers: { ...headers, 'Content-Type': 'multipart/form-data' },
       });
+      // The file is processed in the background; plots and group-bys are refused until it is ready
+      let upload = response.data;
+      for (let polls = 0; upload.status === 'pending' || upload.status === 'processing'; polls++) {
+        if (polls >= MAX_POLLS) {
+          setError('The file is taking too long to process. Please try uploading it again later.');
+          return;
+        }
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+        ({ data: upload } = await axios.get(`http://localhost:8000/survey-analyzer/csv-uploads/${response.data.id}/`, { headers }));
+      }
+      if (upload.status !== 'ready') {
+        setError(`Failed to process file: ${upload.processing_error || 'unknown error'}`);
+        return;
+      }
       setColumns(response.data.columns);
       setCsvUploadId(response.data.id);
     } catch (err) {
@@ -173,14 +191,26 @@ const SurveyAnalyzer = () => {
     setError(null);
 
     try {
-      const response = await axios.post('http://localhost:8000/survey-analyzer/publish-analysis/', {
+      const headers = {
+        'Authorization': `Bearer ${localStorage.getItem('access_token')}`,
+        'Content-Type': 'application/json',
+      };
+      let { data: report } = await axios.post('http://localhost:8000/survey-analyzer/publish-analysis/', {
         analysis_id: csvUploadId,
-      }, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('access_token')}`,
-          'Content-Type': 'application/json',
-        },
-      });
+      }, { headers });
+      // The PDF is generated in the background; poll until it is ready
+      for (let polls = 0; report.status === 'pending' || report.status === 'processing'; polls++) {
+        if (polls >= MAX_POLLS) {
+          setError('The report is taking too long to generate. Please try publishing again later.');
+          return;
+        }
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+        ({ data: report } = await axios.get(`http://localhost:8000/survey-analyzer/publish-analysis/${report.id}/`, { headers }));
+      }
+      if (report.status !== 'ready') {
+        throw new Error(report.error);
+      }
+      const response = await axios.get(report.download_url, { headers, responseType: 'blob' });
       const blob = new Blob([response.data], { type: 'application/pdf' });
       const link = document.createElement('a');
       link.href = window.URL.createObjectURL(blob);